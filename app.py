@@ -1,19 +1,39 @@
 """親子資訊素養工作坊 - 檔案上傳系統 (Firebase 版)"""
 import os
+import re
 import json
 import base64
-from datetime import datetime
-from flask import Flask, render_template, request, redirect, url_for, flash, send_file, jsonify
+import mimetypes
+import hashlib
+import hmac
+import importlib
+import functools
+import random
+import string
+import threading
+import time
+import click
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+from urllib.parse import quote
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, render_template, request, redirect, url_for, flash, send_file, jsonify, Response, g, make_response, session, stream_with_context
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user, UserMixin
 from werkzeug.utils import secure_filename
 from werkzeug.security import generate_password_hash, check_password_hash
-import csv
+from itsdangerous import URLSafeTimedSerializer, BadSignature
+import shutil
 from io import StringIO, BytesIO
-import zipfile
 
-import firebase_admin
-from firebase_admin import credentials, firestore, storage
+try:
+    import fcntl
+except ImportError:  # Windows 開發環境沒有 fcntl，僅單一行程時不需要檔案鎖
+    fcntl = None
+
 from config import Config
+import assets
+import metrics
 import dotenv
 
 dotenv.load_dotenv()
@@ -22,10 +42,51 @@ dotenv.load_dotenv()
 app = Flask(__name__)
 app.config.from_object(Config)
 
+if app.config['TRUSTED_PROXY_HOPS']:
+    # 經由反向代理時以 X-Forwarded-* 還原用戶端 IP 與網址 (request.remote_addr、url_for(_external=True))
+    from werkzeug.middleware.proxy_fix import ProxyFix
+    hops = app.config['TRUSTED_PROXY_HOPS']
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=hops, x_proto=hops, x_host=hops)
+
 # ============== Firebase 初始化 ==============
 
+class LazyModule:
+    """第一次存取屬性時才匯入的模組"""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+
+# firebase_admin 與 google-cloud 套件匯入很慢，等到第一次使用時才匯入，
+# 讓 worker 啟動後能立即處理不需要 Firebase 的請求 (例如首頁、/healthz)
+firestore = LazyModule('firebase_admin.firestore')
+storage = LazyModule('firebase_admin.storage')
+
+
+def transactional(func):
+    """等同 @firestore.transactional，但延後到第一次呼叫時才匯入 firestore"""
+    wrapped = None
+
+    @functools.wraps(func)
+    def wrapper(transaction, *args, **kwargs):
+        nonlocal wrapped
+        if wrapped is None:
+            wrapped = firestore.transactional(func)
+        return wrapped(transaction, *args, **kwargs)
+    return wrapper
+
+
 def init_firebase():
     """初始化 Firebase Admin SDK"""
+    import firebase_admin
+    from firebase_admin import credentials
+
     cred = None
     
     # 1. 嘗試從環境變數讀取 (Zeabur 部署用)
@@ -78,11 +139,160 @@ def init_firebase():
         print("❌ 找不到 Firebase 憑證 (FIREBASE_CREDENTIALS env 或 serviceAccountKey.json)")
         return None
 
-# 初始化資料庫客戶端
-db = init_firebase()
+class LazyFirestore:
+    """第一次使用時才初始化 Firebase 的 Firestore 用戶端
+
+    用法與 firestore.client() 相同；初始化失敗時 bool(db) 為 False，
+    與原本 `if not db` 的檢查方式一致。初始化完成後會呼叫 on_ready。
+    初始化或 on_ready 失敗時不會永久放棄，而是每隔 retry_interval 秒於下次使用時重試。
+    """
+
+    def __init__(self, factory, on_ready=None, retry_interval=30):
+        self._factory = factory
+        self._on_ready = on_ready
+        self.retry_interval = retry_interval
+        self._client = None
+        self._ready = False
+        self._last_attempt = None
+        self._last_ready_attempt = None
+        self.last_error = None
+        self._lock = threading.RLock()
+
+    @property
+    def initialized(self):
+        return self._last_attempt is not None
+
+    def _due(self, last_attempt):
+        return last_attempt is None or time.monotonic() - last_attempt >= self.retry_interval
+
+    def get(self):
+        if self._client is None and self._due(self._last_attempt):
+            with self._lock:
+                if self._client is None and self._due(self._last_attempt):
+                    self._last_attempt = time.monotonic()
+                    try:
+                        self._client = self._factory()
+                    except Exception as e:
+                        print(f"❌ Firebase 初始化錯誤: {e}")
+                    if self._client is None:
+                        self.last_error = 'Firebase 初始化失敗'
+        if self._client is not None and not self._ready and self._due(self._last_ready_attempt):
+            with self._lock:
+                if not self._ready and self._due(self._last_ready_attempt):
+                    # 先記錄嘗試時間，on_ready 內使用 db 時才不會再次執行
+                    self._last_ready_attempt = time.monotonic()
+                    try:
+                        if self._on_ready:
+                            self._on_ready()
+                        self._ready = True
+                        self.last_error = None
+                    except Exception as e:
+                        self.last_error = f'初始化後續作業失敗: {e}'
+                        print(f"⚠️ Firebase 初始化後續作業失敗，{self.retry_interval} 秒後重試: {e}")
+        return self._client
+
+    def status(self):
+        """本行程所知的初始化狀態 (不連線 Firebase)"""
+        if not self.initialized:
+            return 'not_initialized'
+        if self._client is None:
+            return 'unavailable'
+        return 'ok' if self._ready else 'degraded'
+
+    def __bool__(self):
+        return self.get() is not None
+
+    def __getattr__(self, name):
+        client = self.get()
+        if client is None:
+            raise RuntimeError("Firebase 未初始化")
+        return getattr(client, name)
+
+
+# 資料庫客戶端：第一次使用時才初始化並確認預設管理員存在、補寫未完成的日誌
+db = LazyFirestore(
+    init_firebase, on_ready=lambda: on_firebase_ready(), retry_interval=app.config['FIREBASE_INIT_RETRY_INTERVAL']
+)
+
+
+def preload_modules():
+    """預先匯入延遲載入的模組
+
+    gunicorn 以 preload_app 啟動時在 fork 前呼叫，所有 worker 共用已載入的模組。
+    只匯入模組、不建立連線 (gRPC 連線不能跨 fork 共用)。
+    """
+    import csv  # noqa: F401
+    import zipfile  # noqa: F401
+    import firebase_admin.firestore  # noqa: F401
+    import firebase_admin.storage  # noqa: F401
+    # 靜態檔案的指紋與壓縮版本也在 fork 前建立
+    static_assets.load()
+
+
+def warm_up():
+    """初始化 Firebase 並建立 Storage 用戶端，回傳是否成功
+
+    可在 worker 啟動後 (gunicorn post_fork) 呼叫，讓第一個請求不必等待初始化。
+    """
+    if not db:
+        return False
+    try:
+        storage.bucket()
+    except Exception as e:
+        print(f"⚠️ Storage 用戶端建立失敗: {e}")
+        return False
+    return True
 
 # ============== 使用者模型 (適配 Flask-Login) ==============
 
+class TTLCache:
+    """執行緒安全的行程內快取：項目超過 ttl 秒即失效，超過 maxsize 時淘汰最久未使用的項目"""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key=None):
+        """移除指定項目；未指定 key 時清空快取"""
+        with self._lock:
+            if key is None:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+    def __len__(self):
+        return len(self._data)
+
+
+# 管理員資料快取，避免每個已登入請求都讀取 Firestore
+admin_cache = TTLCache(app.config['ADMIN_CACHE_SIZE'], app.config['ADMIN_CACHE_TTL'])
+metrics.Counter('admin_cache_hits_total', '管理員資料快取命中次數', function=lambda: admin_cache.hits)
+metrics.Counter('admin_cache_misses_total', '管理員資料快取未命中次數', function=lambda: admin_cache.misses)
+
 class AdminUser(UserMixin):
     def __init__(self, uid, username, password_hash):
         self.id = uid
@@ -92,12 +302,23 @@ class AdminUser(UserMixin):
     @staticmethod
     def get(user_id):
         if not db: return None
-        doc = db.collection('admins').document(user_id).get()
+        user = admin_cache.get(user_id)
+        if user is not None:
+            return user
+        with metrics.timed('firestore', 'admin_get'):
+            doc = db.collection('admins').document(user_id).get()
         if doc.exists:
             data = doc.to_dict()
-            return AdminUser(user_id, data['username'], data['password_hash'])
+            user = AdminUser(user_id, data['username'], data['password_hash'])
+            admin_cache.set(user_id, user)
+            return user
         return None
 
+    @staticmethod
+    def invalidate(user_id=None):
+        """管理員資料變更後呼叫，讓下次請求重新從 Firestore 讀取"""
+        admin_cache.invalidate(user_id)
+
 # ============== Login Manager ==============
 
 login_manager = LoginManager()
@@ -112,6 +333,29 @@ def load_user(user_id):
 
 # ============== 輔助函數 ==============
 
+# Firestore 單一 batch 最多 500 筆寫入
+FIRESTORE_BATCH_LIMIT = 500
+
+# 計算內容雜湊時每次讀取的大小
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# 搜尋索引：建立索引的欄位、英數字詞 / 非 ASCII 片段的切分規則、英數字前綴最大長度
+SEARCH_FIELDS = ('child_name', 'parent_info', 'original_filename')
+SEARCH_TOKEN_PATTERN = re.compile(r'[a-z0-9]+|[^\W_a-z0-9]+')
+SEARCH_PREFIX_MAX = 15
+
+# 上傳用執行緒池：同一 worker 內所有請求共用，並行數量由 UPLOAD_CONCURRENCY 限制
+upload_executor = ThreadPoolExecutor(
+    max_workers=app.config['UPLOAD_CONCURRENCY'],
+    thread_name_prefix='upload'
+)
+
+# 刪除 Storage 檔案用執行緒池：與上傳分開，管理員批次刪除時不會拖慢家長上傳
+delete_executor = ThreadPoolExecutor(
+    max_workers=app.config['DELETE_CONCURRENCY'],
+    thread_name_prefix='delete'
+)
+
 def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
@@ -123,13 +367,507 @@ def format_file_size(size):
         size /= 1024.0
     return f"{size:.2f} TB"
 
+def build_blob_name(original_filename):
+    """產生 Storage 內部路徑：uploads/{時間}_{隨機字串}_{安全檔名}"""
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    # 加入隨機字串避免同一秒多檔名衝突
+    random_str = ''.join(random.choices(string.ascii_lowercase + string.digits, k=4))
+
+    # 為了避免 Storage 路徑問題，blob_name 使用安全編碼後的名稱
+    # 這裡使用 secure_filename 確保路徑安全 (它會移除中文，但沒關係，blob_name 只是內部路徑)
+    # 如果 secure_filename 後變空 (例如純中文檔名)，給一個預設值
+    safe_name = secure_filename(original_filename)
+    if not safe_name:
+        safe_name = "file" + os.path.splitext(original_filename)[1]
+
+    return f"uploads/{timestamp}_{random_str}_{safe_name}"
+
+def set_download_metadata(blob, original_filename):
+    """設定 metadata，確保下載時瀏覽器能看到正確的中文檔名"""
+    try:
+        encoded_filename = quote(original_filename)
+        blob.content_disposition = f"attachment; filename*=utf-8''{encoded_filename}"
+        blob.metadata = {'original_filename': original_filename}
+    except Exception as e:
+        print(f"Metadata 設定警告: {e}")
+
+CONTENT_BLOB_PREFIX = 'uploads/sha256/'
+
+def content_blob_name(content_hash):
+    """內容定址的 Storage 路徑：uploads/sha256/{雜湊值}"""
+    return f"{CONTENT_BLOB_PREFIX}{content_hash}"
+
+def blob_ref_doc(content_hash):
+    """記錄共用 blob 被多少筆 submissions 引用：blob_refs/{雜湊值}"""
+    return db.collection('blob_refs').document(content_hash)
+
+def add_blob_ref(content_hash):
+    """登記一筆對共用 blob 的引用 (在確認 blob 存在之前呼叫)"""
+    with metrics.timed('firestore', 'set'):
+        blob_ref_doc(content_hash).set({
+            'ref_count': firestore.Increment(1),
+            'storage_path': content_blob_name(content_hash)
+        }, merge=True)
+
+def touch_blob(blob):
+    """更新 blob 的 metadata 讓 metageneration 改變，回傳 blob 是否仍存在
+
+    delete_blobs 刪除共用 blob 時以刪除前讀到的 metageneration 為前提條件，
+    因此登記引用後 touch 過的 blob 不會再被刪除；touch 前就被刪除時回傳 False，由呼叫端重新上傳。
+    """
+    with metrics.timed('storage', 'exists'):
+        if not blob.exists():
+            return False
+    blob.metadata = {'referenced_at': datetime.utcnow().isoformat()}
+    try:
+        with metrics.timed('storage', 'patch'):
+            blob.patch()
+    except Exception:
+        with metrics.timed('storage', 'exists'):
+            if blob.exists():
+                raise
+        return False
+    return True
+
+def upload_to_storage(bucket, file):
+    """上傳單一檔案到 Storage
+
+    回傳 (寫入 Firestore 所需的檔案欄位, 是否新建立了 blob)；
+    內容相同的 blob 已存在時不會重複上傳。
+    blob 的引用次數在這裡就先登記，記錄寫入失敗時需呼叫 release_blob_refs 撤銷。
+    會在上傳執行緒池中執行，因此不可存取 request 物件。
+    """
+    # 保留原始中文檔名，只做基本路徑清理
+    original_filename = os.path.basename(file.filename)
+
+    # 邊讀取邊計算 SHA-256 與檔案大小
+    digest = hashlib.sha256()
+    file_size = 0
+    for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b''):
+        digest.update(chunk)
+        file_size += len(chunk)
+    file.seek(0)
+    content_hash = digest.hexdigest()
+
+    # 以內容雜湊命名，相同內容的檔案共用同一個 blob
+    blob_name = content_blob_name(content_hash)
+    blob = bucket.blob(blob_name)
+
+    # 先登記引用再確認 blob 存在：同時刪除最後一筆引用的請求不會刪掉我們要共用的 blob，
+    # 若 blob 在登記前已被刪除，touch_blob 會發現並改為重新上傳
+    add_blob_ref(content_hash)
+    try:
+        created = not touch_blob(blob)
+        if created:
+            set_download_metadata(blob, original_filename)
+            with metrics.timed('storage', 'upload'):
+                blob.upload_from_file(file, content_type=file.content_type)
+    except Exception:
+        release_blob_refs(bucket, [content_hash])
+        raise
+
+    return {
+        # 檔案不公開，file_url 只保留物件位置，管理員經由 /admin/file 讀取
+        'file_url': blob.public_url,
+        'storage_path': blob_name, # 用於刪除
+        'content_hash': content_hash,
+        'original_filename': original_filename,
+        'file_size': file_size,
+    }, created
+
+def build_search_tokens(record):
+    """建立 submission 的搜尋索引 token
+
+    中文等非 ASCII 文字切成單字與雙字 (bigram)，英數字詞則索引所有前綴，
+    讓「王小」或「work」這類部分字串也能查到。
+    """
+    tokens = set()
+    for field in SEARCH_FIELDS:
+        for run in SEARCH_TOKEN_PATTERN.findall((record.get(field) or '').lower()):
+            if run.isascii():
+                tokens.update(run[:i] for i in range(1, min(len(run), SEARCH_PREFIX_MAX) + 1))
+            else:
+                tokens.update(run)
+                tokens.update(run[i:i + 2] for i in range(len(run) - 1))
+    return sorted(tokens)
+
+def search_query_tokens(search):
+    """將搜尋字串轉成查詢 token，文件必須包含全部 token 才算符合"""
+    tokens = set()
+    for run in SEARCH_TOKEN_PATTERN.findall(search.lower()):
+        if run.isascii():
+            tokens.add(run[:SEARCH_PREFIX_MAX])
+        elif len(run) == 1:
+            tokens.add(run)
+        else:
+            tokens.update(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+def stats_shards_ref():
+    """統計計數器的分片集合：stats/submissions/shards/{0..COUNTER_SHARDS-1}"""
+    return db.collection('stats').document('submissions').collection('shards')
+
+def increment_submission_stats(batch, count, total_size, records=()):
+    """在 batch 中調整提交數與總大小計數器，並遞增 submissions 版本
+
+    隨機挑選一個分片寫入，避免同時上傳時都搶同一份文件。
+    各分片 version 的總和在 submissions 有任何變動時增加，用於產生 ETag。
+    records 為新增 (count > 0) 或刪除 (count < 0) 的記錄，同時更新每日統計。
+    """
+    shard_id = str(random.randrange(app.config['COUNTER_SHARDS']))
+    batch.set(stats_shards_ref().document(shard_id), {
+        'count': firestore.Increment(count),
+        'total_size': firestore.Increment(total_size),
+        'version': firestore.Increment(1)
+    }, merge=True)
+    if records:
+        increment_daily_stats(batch, records, -1 if count < 0 else 1, shard_id)
+
+
+# 每日統計所用的時區
+STATS_TZ = ZoneInfo(app.config['STATS_TIMEZONE'])
+
+
+def local_time(value):
+    """上傳時間 (未帶時區者為 UTC) 轉為統計時區"""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(STATS_TZ)
+
+
+def local_midnight_utc(day):
+    """統計時區某天 00:00 對應的 UTC 時間 (與 upload_time 相同，不帶時區)"""
+    midnight = datetime(day.year, day.month, day.day, tzinfo=STATS_TZ)
+    return midnight.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def daily_stats_ref():
+    """每日統計：stats_daily/{YYYY-MM-DD}-{分片}，每小時的數字存在 hours.{HH}"""
+    return db.collection('stats_daily')
+
+
+def increment_daily_stats(batch, records, sign, shard_id):
+    """在 batch 中依統計時區的日期與小時調整提交數與總大小"""
+    days = {}
+    for record in records:
+        upload_time = record.get('upload_time')
+        if not hasattr(upload_time, 'astimezone'):
+            continue
+        upload_time = local_time(upload_time)
+        hours = days.setdefault(upload_time.strftime('%Y-%m-%d'), {})
+        bucket = hours.setdefault(upload_time.strftime('%H'), [0, 0])
+        bucket[0] += 1
+        bucket[1] += record.get('file_size', 0)
+
+    for day, hours in days.items():
+        batch.set(daily_stats_ref().document(f"{day}-{shard_id}"), {
+            'date': day,
+            'count': firestore.Increment(sign * sum(count for count, _ in hours.values())),
+            'total_size': firestore.Increment(sign * sum(size for _, size in hours.values())),
+            'hours': {
+                hour: {'count': firestore.Increment(sign * count), 'total_size': firestore.Increment(sign * size)}
+                for hour, (count, size) in hours.items()
+            }
+        }, merge=True)
+
+
+# 分片加總與每日統計的短期快取 (管理後台每次重新整理都需要)
+stats_cache = TTLCache(32, app.config['STATS_CACHE_TTL'])
+
+
+def read_submission_stats():
+    """加總計數器分片，回傳 {'count', 'total_size', 'version'} (讀取次數只與分片數有關)"""
+    stats = stats_cache.get('submissions')
+    if stats is None:
+        stats = {'count': 0, 'total_size': 0, 'version': 0}
+        with metrics.timed('firestore', 'stats_get'):
+            shards = list(stats_shards_ref().stream())
+        for shard in shards:
+            data = shard.to_dict()
+            for field in stats:
+                stats[field] += data.get(field, 0)
+        stats_cache.set('submissions', stats)
+    return stats
+
+
+def read_daily_stats(first_day, last_day):
+    """讀取日期範圍 (含頭尾) 的每日統計 {日期: {'count', 'total_size', 'hours'}}
+
+    讀取次數只與天數和分片數有關，與記錄數無關。
+    """
+    key = ('daily', first_day.isoformat(), last_day.isoformat())
+    days = stats_cache.get(key)
+    if days is None:
+        days = {}
+        query = (daily_stats_ref()
+                 .where('date', '>=', first_day.isoformat())
+                 .where('date', '<=', last_day.isoformat()))
+        with metrics.timed('firestore', 'daily_stats_get'):
+            shards = list(query.stream())
+        for shard in shards:
+            data = shard.to_dict()
+            day = days.setdefault(data['date'], {'count': 0, 'total_size': 0, 'hours': {}})
+            day['count'] += data.get('count', 0)
+            day['total_size'] += data.get('total_size', 0)
+            for hour, values in data.get('hours', {}).items():
+                bucket = day['hours'].setdefault(hour, {'count': 0, 'total_size': 0})
+                bucket['count'] += values.get('count', 0)
+                bucket['total_size'] += values.get('total_size', 0)
+        stats_cache.set(key, days)
+    return days
+
+
+def notify_submissions_changed(archive=True):
+    """submissions 寫入完成後呼叫：讓統計快取失效，並在背景更新下載全部快取"""
+    stats_cache.invalidate()
+    if archive:
+        schedule_archive_refresh()
+
+def save_submissions(records, doc_ids=None):
+    """以 Firestore batch 一次寫入多筆 submissions 記錄
+
+    同一個 batch 也會更新統計計數器 (blob 引用次數已在 upload_to_storage 登記)。
+    doc_ids 為預先配置的文件 ID (write-behind 日誌與直傳 finalize 使用)，未指定時自動產生。
+    記錄以 create 寫入：指定的文件 ID 已存在時 (重送 finalize、日誌重試) 略過該筆，統計不會重複計算。
+    寫入後在背景替圖片產生縮圖，回傳實際寫入的各記錄 DocumentReference。
+    """
+    submissions_ref = db.collection('submissions')
+    doc_ids = list(doc_ids) if doc_ids is not None else [None] * len(records)
+    pending = []
+    seen = set()
+    for record, doc_id in zip(records, doc_ids):
+        if doc_id is not None:
+            if doc_id in seen:
+                continue
+            seen.add(doc_id)
+        pending.append((submissions_ref.document(doc_id), record))
+
+    def commit(chunk):
+        batch = db.batch()
+        for doc_ref, record in chunk:
+            batch.create(doc_ref, {**record, 'search_tokens': build_search_tokens(record)})
+        increment_submission_stats(
+            batch, len(chunk), sum(record.get('file_size', 0) for _, record in chunk), [record for _, record in chunk]
+        )
+        with metrics.timed('firestore', 'batch_commit'):
+            batch.commit()
+
+    written = []
+    # 每筆記錄最多再加一筆每日統計寫入，另保留一筆寫入給計數器分片
+    chunk_size = (FIRESTORE_BATCH_LIMIT - 1) // 2
+    for start in range(0, len(pending), chunk_size):
+        chunk = pending[start:start + chunk_size]
+        try:
+            commit(chunk)
+        except Exception:
+            # 可能是部分文件已存在 (batch 整批不會寫入)：略過已存在的記錄後重寫一次
+            with metrics.timed('firestore', 'get_all'):
+                existing = {snapshot.id for snapshot in db.get_all([doc_ref for doc_ref, _ in chunk]) if snapshot.exists}
+            if not existing:
+                raise
+            chunk = [(doc_ref, record) for doc_ref, record in chunk if doc_ref.id not in existing]
+            if chunk:
+                commit(chunk)
+        written.extend(chunk)
+
+    doc_refs = [doc_ref for doc_ref, _ in written]
+    records = [record for _, record in written]
+    metrics.UPLOAD_FILES.labels('accepted').inc(len(records))
+    metrics.UPLOAD_BYTES.inc(sum(r.get('file_size', 0) for r in records))
+    if records:
+        notify_submissions_changed()
+    schedule_image_derivatives(doc_refs, records)
+    return doc_refs
+
+@transactional
+def delete_submission_records(transaction, doc_refs):
+    """刪除多筆 submissions 並扣除計數器與 blob 引用次數 (單一交易)
+
+    回傳 (已刪除的記錄 {id: 內容}, 需要刪除的 Storage 路徑 {id: 路徑})，不存在的記錄會被略過。
+    內容定址的 blob 只有在最後一筆引用被刪除時才需要刪除；
+    舊資料 (沒有 content_hash) 的 blob 則一律刪除。
+    每筆記錄最多產生三筆寫入 (記錄、引用次數、每日統計)，另有一筆計數器分片寫入，
+    因此每次最多傳入 (FIRESTORE_BATCH_LIMIT - 1) // 3 筆 (166 筆)，確保寫入數不超過上限。
+    """
+    deleted = {
+        snapshot.id: snapshot.to_dict()
+        for snapshot in db.get_all(doc_refs, transaction=transaction)
+        if snapshot.exists
+    }
+
+    released_hashes = decrement_blob_refs(
+        transaction, [data['content_hash'] for data in deleted.values() if data.get('content_hash')]
+    )
+
+    orphaned_paths = {}
+    for doc_ref in doc_refs:
+        data = deleted.get(doc_ref.id)
+        if data is None:
+            continue
+        transaction.delete(doc_ref)
+        content_hash = data.get('content_hash')
+        if data.get('storage_path') and (not content_hash or content_hash in released_hashes):
+            orphaned_paths[doc_ref.id] = data['storage_path']
+
+    if deleted:
+        increment_submission_stats(
+            transaction, -len(deleted), -sum(data.get('file_size', 0) for data in deleted.values()),
+            list(deleted.values())
+        )
+    return deleted, orphaned_paths
+
+def decrement_blob_refs(transaction, content_hashes):
+    """在交易中扣除 blob 引用次數 (每出現一次扣一次)，回傳已無任何引用的雜湊值"""
+    ref_releases = {}
+    for content_hash in content_hashes:
+        ref_releases[content_hash] = ref_releases.get(content_hash, 0) + 1
+    if not ref_releases:
+        return set()
+
+    ref_counts = {}
+    ref_docs = [blob_ref_doc(content_hash) for content_hash in ref_releases]
+    for snapshot in db.get_all(ref_docs, transaction=transaction):
+        if snapshot.exists:
+            ref_counts[snapshot.id] = snapshot.to_dict().get('ref_count', 0)
+
+    released_hashes = set()
+    for content_hash, released in ref_releases.items():
+        if ref_counts.get(content_hash, 0) > released:
+            transaction.update(blob_ref_doc(content_hash), {'ref_count': firestore.Increment(-released)})
+        else:
+            transaction.delete(blob_ref_doc(content_hash))
+            released_hashes.add(content_hash)
+    return released_hashes
+
+@transactional
+def release_blob_refs_transaction(transaction, content_hashes):
+    """decrement_blob_refs 的單一交易版本"""
+    return decrement_blob_refs(transaction, content_hashes)
+
+def release_blob_refs(bucket, content_hashes):
+    """撤銷 upload_to_storage 登記的引用 (記錄寫入失敗時)，已無引用的 blob 一併刪除"""
+    content_hashes = list(content_hashes)
+    if not content_hashes:
+        return
+    released = release_blob_refs_transaction(db.transaction(), content_hashes)
+    # 可能在 upload_executor 的工作中呼叫，直接逐一刪除，不可再等待同一個執行緒池 (會互相等待而卡死)
+    for content_hash in released:
+        delete_blob(bucket, content_blob_name(content_hash))
+
+def delete_unreferenced_blob(bucket, path):
+    """刪除已無引用的共用 blob
+
+    先讀取 blob 的 generation / metageneration，再確認 blob_refs 仍沒有引用，
+    最後以這兩個值為前提條件刪除：期間有請求登記引用並 touch_blob 時 metageneration 已改變，刪除會失敗而保留 blob。
+    """
+    with metrics.timed('storage', 'exists'):
+        blob = bucket.get_blob(path)
+    if blob is None:
+        return
+    ref_doc = blob_ref_doc(path.rsplit('/', 1)[1])
+
+    def referenced():
+        with metrics.timed('firestore', 'get'):
+            snapshot = ref_doc.get()
+        return snapshot.exists and snapshot.to_dict().get('ref_count', 0) > 0
+
+    if referenced():
+        return
+    try:
+        with metrics.timed('storage', 'delete'):
+            blob.delete(if_generation_match=blob.generation, if_metageneration_match=blob.metageneration)
+    except Exception:
+        # 前提條件不符：刪除前剛被重新引用，blob 應保留
+        if referenced():
+            return
+        raise
+
+def delete_blob(bucket, path):
+    """刪除單一 Storage 檔案 (盡力而為)，回傳是否成功
+
+    內容定址的共用 blob 以 delete_unreferenced_blob 刪除，不會刪掉剛被重新引用的 blob。
+    """
+    try:
+        if path.startswith(CONTENT_BLOB_PREFIX):
+            delete_unreferenced_blob(bucket, path)
+        else:
+            with metrics.timed('storage', 'delete'):
+                bucket.blob(path).delete()
+        return True
+    except Exception as e:
+        print(f"刪除 Storage 檔案失敗 {path}: {e}")
+        return False
+
+def delete_blobs(bucket, storage_paths):
+    """透過刪除用執行緒池平行刪除 Storage 檔案 (盡力而為)，回傳刪除失敗的路徑"""
+    paths = list(set(storage_paths))
+    results = delete_executor.map(functools.partial(delete_blob, bucket), paths)
+    return {path for path, deleted in zip(paths, results) if not deleted}
+
+def parse_time_range(since, until):
+    """解析 since / until 查詢參數，回傳與 upload_time 相同的 UTC 時間
+
+    只給日期 (YYYY-MM-DD) 時以 STATS_TIMEZONE 的整天計算，until 包含當天整天；
+    ISO 8601 時間未帶時區視為 UTC。格式錯誤時拋出 ValueError。
+    """
+    def parse(value, end=False):
+        if not value:
+            return None
+        if len(value) == 10:
+            day = datetime.strptime(value, '%Y-%m-%d').date()
+            return local_midnight_utc(day + timedelta(days=1) if end else day)
+        parsed = datetime.fromisoformat(value)
+        if parsed.tzinfo is not None:
+            parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+        return parsed
+
+    return parse(since), parse(until, end=True)
+
+def apply_time_range(query, since, until):
+    """將 upload_time 範圍條件加入 Firestore 查詢 (since 含、until 不含)"""
+    if since:
+        query = query.where('upload_time', '>=', since)
+    if until:
+        query = query.where('upload_time', '<', until)
+    return query
+
+def iter_query_pages(query, page_size):
+    """以 Firestore cursor 逐頁讀取查詢結果，每次回傳一頁的文件列表"""
+    last_doc = None
+    while True:
+        page_query = query.limit(page_size)
+        if last_doc is not None:
+            page_query = page_query.start_after(last_doc)
+        with metrics.timed('firestore', 'query'):
+            docs = list(page_query.stream())
+        if docs:
+            yield docs
+        if len(docs) < page_size:
+            return
+        last_doc = docs[-1]
+
+def encode_cursor(doc):
+    """將文件的 (upload_time, 文件 ID) 編碼成網址安全的分頁 cursor"""
+    payload = json.dumps([doc.get('upload_time').isoformat(), doc.id])
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    """解碼分頁 cursor，格式錯誤時拋出 ValueError"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        upload_time, doc_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(upload_time), doc_id
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"無效的分頁 cursor: {cursor}") from e
+
 def ensure_admin_exists():
     """確保預設管理員存在 (類似 init_db)"""
     if not db: return
     
     admins_ref = db.collection('admins')
     # 檢查是否為空
-    docs = list(admins_ref.limit(1).stream())
+    with metrics.timed('firestore', 'query'):
+        docs = list(admins_ref.limit(1).stream())
     
     if not docs:
         print("建立預設管理員帳號...")
@@ -139,249 +877,1408 @@ def ensure_admin_exists():
             'password_hash': generate_password_hash('admin123'),
             'created_at': datetime.utcnow()
         }
-        admins_ref.add(new_admin)
+        with metrics.timed('firestore', 'add'):
+            _, admin_ref = admins_ref.add(new_admin)
+        AdminUser.invalidate(admin_ref.id)
         print("✓ 預設管理員帳號建立完成 (admin / admin123)")
 
-# 啟動時檢查
-if db:
-    ensure_admin_exists()
 
+# ============== 提交記錄日誌 (write-behind) ==============
+#
+# 啟用 SUBMISSION_JOURNAL 時，上傳完成的記錄先附加到本機日誌檔並 fsync 後就回應家長，
+# 背景執行緒再把多個請求的記錄合併成 Firestore batch 寫入。
+# Firestore 短暫變慢或中斷時，已傳到 Storage 的檔案不會因記錄寫入失敗而被刪除，恢復後自動補寫。
+#
+# - 每個行程寫入自己的日誌檔 (segment) 並持有檔案鎖；每次寫入 Firestore 前換新檔，成功後才刪除舊檔
+# - Firebase 初始化時重播沒有行程持有鎖的日誌檔 (異常結束的行程留下的)
+# - 文件 ID 在寫入日誌時就決定，重試與重播時略過已存在的記錄，統計計數器不會重複計算
+# - blob 引用次數在上傳時 (upload_to_storage) 就已登記，記錄仍在日誌中時刪除共用同一檔案的其他記錄也不會刪除該檔案；
+#   reconcile-stats 重建引用次數時會一併計入本機日誌中的記錄
 
-# ============== 公開路由（家長使用） ==============
 
-@app.route('/')
-def index():
-    return render_template('index.html')
+def new_document_id():
+    """與 Firestore 自動產生的 ID 相同格式 (20 個英數字)"""
+    return ''.join(random.SystemRandom().choices(string.ascii_letters + string.digits, k=20))
 
 
-@app.route('/submit', methods=['POST'])
-def submit():
-    if not db:
-        flash('系統錯誤：資料庫未連接', 'danger')
-        return redirect(url_for('index'))
+def journal_encode(value):
+    if isinstance(value, datetime):
+        return {'$datetime': value.isoformat()}
+    raise TypeError(f"無法寫入日誌的型別: {type(value).__name__}")
 
-    try:
-        child_name = request.form.get('child_name', '').strip()
-        parent_info = request.form.get('parent_info', '').strip()
-        
-        if not child_name:
-            flash('請填寫孩子姓名', 'danger')
-            return redirect(url_for('index'))
-        
-        if 'file' not in request.files:
-            flash('請選擇要上傳的檔案', 'danger')
-            return redirect(url_for('index'))
-        
-        files = request.files.getlist('file')
-        
-        if not files or files[0].filename == '':
-            flash('請選擇要上傳的檔案', 'danger')
-            return redirect(url_for('index'))
-            
-        bucket = storage.bucket()
-        if not bucket:
-            flash('系統錯誤：無法連接到雲端儲存', 'danger')
-            return redirect(url_for('index'))
-            
-        success_count = 0
-        fail_count = 0
-        
-        for file in files:
-            if file.filename == '' or not allowed_file(file.filename):
-                fail_count += 1
-                continue
-                
-            try:
-                # 檔案處理
-                # 保留原始中文檔名，只做基本路徑清理
-                original_filename = os.path.basename(file.filename)
-                
-                file.seek(0, 2)
-                file_size = file.tell()
-                file.seek(0)
-                
-                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                # 加入隨機字串避免同一秒多檔名衝突
-                import random
-                import string
-                random_str = ''.join(random.choices(string.ascii_lowercase + string.digits, k=4))
-                
-                # 為了避免 Storage 路徑問題，blob_name 使用安全編碼後的名稱
-                # 這裡使用 secure_filename 確保路徑安全 (它會移除中文，但沒關係，blob_name 只是內部路徑)
-                # 如果 secure_filename 後變空 (例如純中文檔名)，給一個預設值
-                safe_name = secure_filename(original_filename)
-                if not safe_name:
-                    safe_name = "file" + os.path.splitext(original_filename)[1]
-                
-                blob_name = f"uploads/{timestamp}_{random_str}_{safe_name}"
-                
-                blob = bucket.blob(blob_name)
-                
-                # 設定 metadata，確保下載時瀏覽器能看到正確的中文檔名
-                try:
-                    from urllib.parse import quote
-                    encoded_filename = quote(original_filename)
-                    blob.content_disposition = f"attachment; filename*=utf-8''{encoded_filename}"
-                    blob.metadata = {'original_filename': original_filename}
-                except Exception as e:
-                    print(f"Metadata 設定警告: {e}")
-                
-                blob.upload_from_file(file, content_type=file.content_type)
-                
-                # 讓檔案公開可讀取
-                blob.make_public()
-                file_url = blob.public_url
-                
-                # 寫入 Firestore
-                submission_data = {
-                    'child_name': child_name,
-                    'parent_info': parent_info,
-                    'file_url': file_url,
-                    'storage_path': blob_name, # 用於刪除
-                    'original_filename': original_filename,
-                    'file_size': file_size,
-                    'upload_time': datetime.utcnow(),
-                    'ip_address': request.remote_addr
-                }
-                
-                db.collection('submissions').add(submission_data)
-                success_count += 1
-                
-            except Exception as e:
-                print(f"單一檔案上傳失敗: {e}")
-                fail_count += 1
-        
-        if success_count > 0:
-            msg = f'成功上傳 {success_count} 個檔案！感謝您的參與 🎉'
-            if fail_count > 0:
-                msg += f' (另有 {fail_count} 個檔案上傳失敗)'
-            flash(msg, 'success')
-        else:
-            flash('檔案上傳失敗，請檢查檔案格式或大小', 'danger')
-            
-        return redirect(url_for('index'))
-        
-    except Exception as e:
-        app.logger.error(f"上傳錯誤: {str(e)}")
-        flash(f'上傳失敗: {str(e)}', 'danger')
-        return redirect(url_for('index'))
 
+def journal_decode(obj):
+    if len(obj) == 1 and '$datetime' in obj:
+        return datetime.fromisoformat(obj['$datetime'])
+    return obj
 
-# ============== 管理員路由 ==============
 
-@app.route('/admin/login', methods=['GET', 'POST'])
-def admin_login():
-    if current_user.is_authenticated:
-        return redirect(url_for('admin_dashboard'))
-    
-    if request.method == 'POST':
-        username = request.form.get('username', '').strip()
-        password = request.form.get('password', '')
-        
-        if db:
-            # 查詢 Firestore
-            docs = db.collection('admins').where('username', '==', username).limit(1).stream()
-            admin_doc = next(docs, None)
-            
-            if admin_doc:
-                data = admin_doc.to_dict()
-                if check_password_hash(data['password_hash'], password):
-                    user = AdminUser(admin_doc.id, data['username'], data['password_hash'])
-                    login_user(user)
-                    flash('登入成功！', 'success')
-                    return redirect(url_for('admin_dashboard'))
-        
-        flash('使用者名稱或密碼錯誤', 'danger')
-    
-    return render_template('login.html')
+class JournalSegment:
+    """一個日誌檔與其中尚未寫入 Firestore 的記錄"""
 
+    def __init__(self, path, file, entries=None, created=None, retry=False):
+        self.path = path
+        self.file = file
+        self.entries = entries or []
+        self.created = created or time.time()
+        # 曾經寫入失敗或來自重播：部分記錄可能已寫入，需先檢查
+        self.retry = retry
 
-@app.route('/admin/logout')
-@login_required
-def admin_logout():
-    logout_user()
-    flash('已成功登出', 'success')
-    return redirect(url_for('index'))
+    def close(self):
+        # 先刪除再釋放檔案鎖，其他行程的重播不會在兩者之間取得鎖而重複寫入
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        self.file.close()
 
 
-@app.route('/admin/dashboard')
-@login_required
-def admin_dashboard():
-    if not db:
-        flash('資料庫連接失敗', 'danger')
-        return redirect(url_for('index'))
+class SubmissionJournal:
+    """submissions 記錄的本機 write-behind 日誌"""
 
-    # 簡單分頁邏輯 (Firestore 分頁較複雜，這裡簡化為獲取全部後在內存分頁)
-    # 註：如果數據量很大，這不是最佳實踐
-    
-    page = request.args.get('page', 1, type=int)
-    search = request.args.get('search', '', type=str)
-    
-    # 獲取所有 submissions
-    submissions_ref = db.collection('submissions').order_by('upload_time', direction=firestore.Query.DESCENDING)
-    all_docs = list(submissions_ref.stream())
-    
-    results = []
-    total_size = 0
-    
-    for doc in all_docs:
-        data = doc.to_dict()
-        data['id'] = doc.id
-        
-        # 搜尋過濾
-        if search:
-            if (search.lower() not in data.get('child_name', '').lower() and
-                search.lower() not in data.get('parent_info', '').lower() and
-                search.lower() not in data.get('original_filename', '').lower()):
-                continue
-        
-        # 格式化
-        data['formatted_size'] = format_file_size(data.get('file_size', 0))
-        total_size += data.get('file_size', 0)
+    def __init__(self, directory, interval, max_retry_delay=30):
+        self.directory = directory
+        self.interval = interval
+        self.max_retry_delay = max_retry_delay
+        self._segment = None
+        self._sealed = deque()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def start(self):
+        """啟動背景寫入執行緒 (每個行程一次，fork 後的 worker 各自啟動；執行緒意外結束時重新啟動)"""
+        with self._lock:
+            if self._pid == os.getpid():
+                if self._thread.is_alive():
+                    return
+                print("提交記錄日誌寫入執行緒已停止，重新啟動")
+            else:
+                self._pid = os.getpid()
+                self._segment = None
+                self._sealed = deque()
+            self._thread = threading.Thread(target=self._run, name='submission-journal', daemon=True)
+            self._thread.start()
+
+    def _open_segment(self):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{os.getpid()}-{time.time_ns()}.jsonl")
+        f = open(path, 'a', encoding='utf-8')
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return JournalSegment(path, f)
+
+    def append(self, records, doc_ids=None):
+        """寫入日誌並 fsync，回傳預先配置的文件 ID (未指定 doc_ids 時隨機產生)"""
+        self.start()
+        doc_ids = list(doc_ids) if doc_ids is not None else [new_document_id() for _ in records]
+        entries = [{'id': doc_id, 'record': record} for record, doc_id in zip(records, doc_ids)]
+        lines = ''.join(
+            json.dumps(entry, default=journal_encode, ensure_ascii=False) + '\n' for entry in entries
+        )
+        with self._lock:
+            if self._segment is None:
+                self._segment = self._open_segment()
+            self._segment.file.write(lines)
+            self._segment.file.flush()
+            os.fsync(self._segment.file.fileno())
+            self._segment.entries.extend(entries)
+        self._wakeup.set()
+        return [entry['id'] for entry in entries]
+
+    def pending(self):
+        """尚未寫入 Firestore 的記錄數"""
+        with self._lock:
+            segments = list(self._sealed) + ([self._segment] if self._segment else [])
+        return sum(len(segment.entries) for segment in segments)
+
+    def lag_seconds(self):
+        """最早一筆尚未寫入 Firestore 的記錄已等待的秒數"""
+        with self._lock:
+            segments = list(self._sealed) + ([self._segment] if self._segment else [])
+        return time.time() - min(segment.created for segment in segments) if segments else 0
+
+    def pending_entries(self):
+        """日誌目錄中 (含同一台主機上其他 worker) 尚未寫入 Firestore 的日誌項目 {'id', 'record'}
+
+        寫入完成的日誌檔會被刪除，因此目錄中仍存在的日誌檔都視為尚未寫入。
+        """
+        if not os.path.isdir(self.directory):
+            return
+        for name in os.listdir(self.directory):
+            if not name.endswith('.jsonl'):
+                continue
+            try:
+                with open(os.path.join(self.directory, name), encoding='utf-8') as f:
+                    lines = f.readlines()
+            except FileNotFoundError:
+                continue
+            for line in lines:
+                try:
+                    entry = json.loads(line, object_hook=journal_decode)
+                except ValueError:
+                    continue
+                if isinstance(entry, dict) and isinstance(entry.get('record'), dict):
+                    yield entry
+
+    def oldest_pending_upload_time(self):
+        """日誌目錄中尚未寫入 Firestore 的記錄最早的 upload_time (UTC)，沒有時回傳 None"""
+        oldest = None
+        for entry in self.pending_entries():
+            upload_time = entry['record'].get('upload_time')
+            if not isinstance(upload_time, datetime):
+                continue
+            if upload_time.tzinfo is not None:
+                upload_time = upload_time.astimezone(timezone.utc).replace(tzinfo=None)
+            if oldest is None or upload_time < oldest:
+                oldest = upload_time
+        return oldest
+
+    def _run(self):
+        try:
+            self.replay()
+        except Exception as e:
+            print(f"重播提交記錄日誌失敗: {e}")
+        retry_delay = self.interval
+        while True:
+            self._wakeup.wait()
+            # 稍候片刻，把同時段多個請求的記錄合併成一次寫入
+            time.sleep(self.interval)
+            self._wakeup.clear()
+            with self._lock:
+                if self._segment is not None:
+                    self._sealed.append(self._segment)
+                    self._segment = None
+            try:
+                flushed = self.flush()
+            except Exception as e:
+                # 任何意外錯誤都不可讓執行緒結束，否則之後的記錄永遠不會寫入
+                print(f"提交記錄日誌寫入執行緒發生錯誤: {e}")
+                flushed = False
+            if flushed:
+                retry_delay = self.interval
+            else:
+                time.sleep(retry_delay)
+                retry_delay = min(retry_delay * 2, self.max_retry_delay)
+                self._wakeup.set()
+
+    def flush(self):
+        """依序寫入已封存的日誌檔，全部成功時回傳 True"""
+        while self._sealed:
+            segment = self._sealed[0]
+            try:
+                self._write(segment)
+            except Exception as e:
+                segment.retry = True
+                print(f"提交記錄寫入 Firestore 失敗，稍後重試 ({len(segment.entries)} 筆): {e}")
+                return False
+            with self._lock:
+                self._sealed.popleft()
+            segment.close()
+        return True
+
+    def _write(self, segment):
+        entries = segment.entries
+        if segment.retry:
+            submissions_ref = db.collection('submissions')
+            existing = set()
+            for start in range(0, len(entries), FIRESTORE_BATCH_LIMIT):
+                refs = [submissions_ref.document(entry['id']) for entry in entries[start:start + FIRESTORE_BATCH_LIMIT]]
+                with metrics.timed('firestore', 'journal_check'):
+                    existing.update(snapshot.id for snapshot in db.get_all(refs) if snapshot.exists)
+            entries = [entry for entry in entries if entry['id'] not in existing]
+        if entries:
+            save_submissions([entry['record'] for entry in entries], [entry['id'] for entry in entries])
+
+    def replay(self):
+        """找出沒有行程持有的日誌檔 (行程異常結束時留下) 排入寫入佇列，回傳記錄數"""
+        if fcntl is None or not os.path.isdir(self.directory):
+            # 沒有檔案鎖時無法判斷日誌檔是否仍被其他行程使用
+            return 0
+
+        replayed = 0
+        for name in sorted(os.listdir(self.directory)):
+            if not name.endswith('.jsonl'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                f = open(path, 'r+', encoding='utf-8')
+            except FileNotFoundError:
+                # 持有的行程剛寫入完成並刪除
+                continue
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                # 仍有行程持有 (包括自己正在寫入的日誌檔)
+                f.close()
+                continue
+            if os.fstat(f.fileno()).st_nlink == 0:
+                # 開啟後才被寫入完成的行程刪除
+                f.close()
+                continue
+            entries = []
+            for line in f:
+                try:
+                    entries.append(json.loads(line, object_hook=journal_decode))
+                except ValueError:
+                    # 寫到一半中斷的最後一行，當時尚未回應用戶端
+                    continue
+            segment = JournalSegment(path, f, entries, created=os.path.getmtime(path), retry=True)
+            with self._lock:
+                self._sealed.append(segment)
+            replayed += len(entries)
+
+        if replayed:
+            print(f"重播提交記錄日誌：{replayed} 筆")
+            self._wakeup.set()
+        return replayed
+
+
+submission_journal = (
+    SubmissionJournal(app.config['SUBMISSION_JOURNAL_DIR'], app.config['SUBMISSION_JOURNAL_INTERVAL'])
+    if app.config['SUBMISSION_JOURNAL'] else None
+)
+metrics.Gauge(
+    'submission_journal_pending_records', '日誌中尚未寫入 Firestore 的記錄數',
+    function=lambda: submission_journal.pending() if submission_journal else 0
+)
+metrics.Gauge(
+    'submission_journal_lag_seconds', '日誌中最早一筆尚未寫入 Firestore 的記錄已等待的秒數',
+    function=lambda: submission_journal.lag_seconds() if submission_journal else 0
+)
+
+
+def persist_submissions(records, doc_ids=None):
+    """保存上傳完成的記錄：啟用日誌時寫入本機日誌後即返回，否則直接寫入 Firestore
+
+    doc_ids 可指定固定的文件 ID，同一 ID 重複保存時只會寫入一筆。
+    """
+    if submission_journal is not None:
+        submission_journal.append(records, doc_ids)
+    else:
+        save_submissions(records, doc_ids)
+
+
+def on_firebase_ready():
+    """Firebase 初始化完成後：確認預設管理員存在，並開始補寫日誌"""
+    ensure_admin_exists()
+    if submission_journal is not None:
+        submission_journal.start()
+
+
+# ============== 圖片縮圖 ==============
+#
+# jpg / png 上傳後在背景產生兩種衍生檔並寫回 submission 記錄：
+#   - 縮圖 (thumbnail_path)：管理後台列表使用，不必載入原圖
+#   - 網頁版 (web_path)：長邊不超過 WEB_RENDITION_MAX_SIDE 的 JPEG，
+#     供「下載全部 (壓縮版)」使用；比原檔小才會保留
+# 衍生檔以內容雜湊命名，內容相同的上傳共用同一組衍生檔。
+
+image_executor = ThreadPoolExecutor(max_workers=app.config['IMAGE_WORKERS'], thread_name_prefix='image')
+
+
+def is_image_file(filename):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in app.config['IMAGE_EXTENSIONS']
+
+
+def derived_blob_name(kind, record):
+    """衍生檔的 Storage 路徑 derived/{kind}/{內容雜湊}.jpg (沒有內容雜湊的記錄改用 storage_path 的雜湊)"""
+    key = record.get('content_hash') or hashlib.sha256(record['storage_path'].encode('utf-8')).hexdigest()
+    return f"derived/{kind}/{key}.jpg"
+
+
+def derived_paths(data):
+    """記錄上已產生的衍生檔路徑"""
+    return [data[field] for field in ('thumbnail_path', 'web_path') if data.get(field)]
+
+
+def render_jpeg(image, max_side, quality):
+    """縮小到長邊不超過 max_side 並輸出 JPEG bytes"""
+    from PIL import Image
+
+    image = image.copy()
+    image.thumbnail((max_side, max_side), Image.LANCZOS)
+    output = BytesIO()
+    image.save(output, 'JPEG', quality=quality, optimize=True, progressive=True)
+    return output.getvalue()
+
+
+def render_derivatives(content):
+    """由原圖產生 (縮圖, 網頁版)；網頁版不比原檔小時回傳 None"""
+    from PIL import Image, ImageOps
+
+    with Image.open(BytesIO(content)) as image:
+        max_side = app.config['WEB_RENDITION_MAX_SIDE']
+        # JPEG 可直接以較低解析度解碼，大幅減少大圖的解碼時間與記憶體
+        image.draft('RGB', (max_side, max_side))
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'L'):
+            # JPEG 不支援透明，透明部分改為白色背景
+            rgba = image.convert('RGBA')
+            image = Image.new('RGB', rgba.size, (255, 255, 255))
+            image.paste(rgba, mask=rgba.getchannel('A'))
+        web = render_jpeg(image, max_side, app.config['WEB_RENDITION_QUALITY'])
+        thumbnail = render_jpeg(image, app.config['THUMBNAIL_SIZE'], 75)
+    return thumbnail, (web if len(web) < len(content) else None)
+
+
+def upload_derivative(bucket, blob_name, content):
+    with metrics.timed('storage', 'upload'):
+        bucket.blob(blob_name).upload_from_string(content, content_type='image/jpeg')
+
+
+def create_image_derivatives(doc_ref, record):
+    """產生縮圖與網頁版並寫回 submission 記錄，回傳是否成功 (在 image_executor 中執行)"""
+    try:
+        import PIL  # noqa: F401
+    except ImportError:
+        print("⚠️ 未安裝 Pillow，略過圖片縮圖")
+        return False
+
+    try:
+        bucket = storage.bucket()
+        thumbnail_name = derived_blob_name('thumb', record)
+        web_name = derived_blob_name('web', record)
+
+        with metrics.timed('storage', 'exists'):
+            reused = bucket.blob(thumbnail_name).exists()
+        if reused:
+            # 相同內容已產生過衍生檔 (重複上傳)，直接沿用
+            fields = {'thumbnail_path': thumbnail_name}
+            with metrics.timed('storage', 'exists'):
+                web_blob = bucket.get_blob(web_name)
+            if web_blob is not None:
+                fields.update({'web_path': web_name, 'web_size': web_blob.size})
+        else:
+            with metrics.timed('storage', 'download'):
+                content = bucket.blob(record['storage_path']).download_as_bytes()
+            thumbnail, web = render_derivatives(content)
+            upload_derivative(bucket, thumbnail_name, thumbnail)
+            fields = {'thumbnail_path': thumbnail_name}
+            if web is not None:
+                upload_derivative(bucket, web_name, web)
+                fields.update({'web_path': web_name, 'web_size': len(web)})
+
+        # 縮圖會改變管理後台的內容，一併遞增 submissions 版本
+        batch = db.batch()
+        batch.update(doc_ref, fields)
+        increment_submission_stats(batch, 0, 0)
+        with metrics.timed('firestore', 'batch_commit'):
+            batch.commit()
+    except Exception as e:
+        metrics.IMAGE_DERIVATIVES.labels('failed').inc()
+        print(f"產生圖片縮圖失敗 ({record.get('storage_path')}): {e}")
+        return False
+
+    metrics.IMAGE_DERIVATIVES.labels('reused' if reused else 'created').inc()
+    # 只有網頁版會改變壓縮版下載的內容
+    notify_submissions_changed(archive='web_path' in fields)
+    return True
+
+
+def schedule_image_derivatives(doc_refs, records):
+    """替圖片記錄排入背景縮圖工作"""
+    if not app.config['IMAGE_DERIVATIVES']:
+        return
+    for doc_ref, record in zip(doc_refs, records):
+        if record.get('storage_path') and is_image_file(record.get('original_filename', '')):
+            image_executor.submit(create_image_derivatives, doc_ref, record)
+
+
+# ============== 上傳流量控制 ==============
+#
+# 整個班級同時上傳時，每個 /submit 請求都會在記憶體中保留最多 10MB 的檔案直到上傳完成。
+# 超過處理能力的請求先短暫排隊，等不到就立即回應 503，並限制單一 IP 的上傳頻率 (429)，
+# 讓已接受的請求能順利完成，而不是所有人一起逾時。
+
+
+class AdmissionController:
+    """限制同時處理的請求數與其總大小，額滿時排隊等待至期限為止"""
+
+    def __init__(self, max_inflight, max_bytes, max_queue, timeout):
+        self.max_inflight = max_inflight
+        self.max_bytes = max_bytes
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.inflight = 0
+        self.buffered_bytes = 0
+        self.waiting = 0
+        self._cond = threading.Condition()
+
+    def _fits(self, size):
+        if self.inflight >= self.max_inflight:
+            return False
+        # 單一請求超過總量上限時，等到沒有其他請求處理中再放行
+        return self.buffered_bytes + size <= self.max_bytes or self.inflight == 0
+
+    def acquire(self, size):
+        """取得處理名額，回傳是否成功"""
+        deadline = time.monotonic() + self.timeout
+        with self._cond:
+            if not self._fits(size):
+                if self.waiting >= self.max_queue:
+                    return False
+                self.waiting += 1
+                metrics.UPLOAD_ADMISSIONS.labels('queued').inc()
+                try:
+                    while not self._fits(size):
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            return False
+                        self._cond.wait(remaining)
+                finally:
+                    self.waiting -= 1
+            self.inflight += 1
+            self.buffered_bytes += size
+            return True
+
+    def release(self, size):
+        with self._cond:
+            self.inflight -= 1
+            self.buffered_bytes -= size
+            self._cond.notify_all()
+
+
+class RateLimiter:
+    """每個 key (IP) 一個 token bucket：每秒補充 rate 個，最多累積 burst 個
+
+    只保留最近使用的 max_keys 個 key，避免大量不同 IP 佔用記憶體。
+    """
+
+    def __init__(self, rate, burst, max_keys=10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> (tokens, 更新時間)
+        self._lock = threading.Lock()
+
+    def consume(self, key):
+        """消耗一個 token，回傳 0 表示允許，否則回傳建議等待的秒數"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            wait = 0 if tokens >= 1 else (1 - tokens) / self.rate
+            if not wait:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+
+submit_admission = AdmissionController(
+    app.config['SUBMIT_MAX_INFLIGHT'],
+    app.config['SUBMIT_MAX_BUFFERED_BYTES'],
+    app.config['SUBMIT_MAX_QUEUE'],
+    app.config['SUBMIT_QUEUE_TIMEOUT']
+)
+# 每個 IP 的頻率限制預設關閉 (見 config.py 的 SUBMIT_RATE_PER_MINUTE)
+submit_rate_limiter = (
+    RateLimiter(app.config['SUBMIT_RATE_PER_MINUTE'] / 60, app.config['SUBMIT_RATE_BURST'])
+    if app.config['SUBMIT_RATE_PER_MINUTE'] > 0 else None
+)
+metrics.Gauge('upload_inflight_requests', '/submit 處理中的請求數', function=lambda: submit_admission.inflight)
+metrics.Gauge('upload_inflight_bytes', '/submit 處理中請求的總大小', function=lambda: submit_admission.buffered_bytes)
+metrics.Gauge('upload_queued_requests', '/submit 排隊中的請求數', function=lambda: submit_admission.waiting)
+
+
+def reject_upload(message, status, retry_after):
+    """以提示訊息回到上傳頁面，並附上 Retry-After"""
+    flash(message, 'warning')
+    response = make_response(render_template('index.html'), status)
+    response.headers['Retry-After'] = str(max(1, int(retry_after + 0.999)))
+    return response
+
+
+def admission_control(view):
+    """在讀取請求內容前進行流量控制，額滿或超過頻率時直接拒絕"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        wait = submit_rate_limiter.consume(request.remote_addr) if submit_rate_limiter else 0
+        if wait:
+            metrics.UPLOAD_ADMISSIONS.labels('rate_limited').inc()
+            return reject_upload('上傳太頻繁，請稍後再試', 429, wait)
+
+        # 依 Content-Length 預估要在記憶體中保留的大小 (超過上限的請求之後會得到 413)
+        size = min(request.content_length or 0, app.config['MAX_CONTENT_LENGTH'])
+        started = time.perf_counter()
+        admitted = submit_admission.acquire(size)
+        metrics.UPLOAD_ADMISSION_WAIT_SECONDS.observe(time.perf_counter() - started)
+        if not admitted:
+            metrics.UPLOAD_ADMISSIONS.labels('overloaded').inc()
+            # 加上隨機秒數，避免被拒絕的用戶端同時重試
+            retry_after = app.config['SUBMIT_RETRY_AFTER'] + random.uniform(0, app.config['SUBMIT_RETRY_AFTER'])
+            return reject_upload('目前上傳人數眾多，請稍候幾秒後再試一次', 503, retry_after)
+
+        metrics.UPLOAD_ADMISSIONS.labels('admitted').inc()
+        try:
+            return view(*args, **kwargs)
+        finally:
+            submit_admission.release(size)
+    return wrapper
+
+
+# ============== 靜態檔案 ==============
+#
+# 模板以 asset_url() 取得帶內容指紋的網址 (/assets/css/style.1a2b3c4d5e6f.css)，
+# 內容改變時網址跟著改變，因此可設定一年且 immutable 的快取；
+# 文字檔依 Accept-Encoding 送出預先壓縮的 br / gzip 版本。
+
+static_assets = assets.AssetManifest(app.static_folder)
+
+# 指紋網址的快取時間 (一年)
+ASSET_MAX_AGE = 365 * 24 * 60 * 60
+
+
+@app.template_global()
+def asset_url(filename):
+    """靜態檔案的指紋網址；開發模式或找不到檔案時使用一般的 /static 網址"""
+    if not app.debug:
+        path = static_assets.url_path(filename)
+        if path:
+            return url_for('serve_asset', filename=path)
+    return url_for('static', filename=filename)
+
+
+@app.route('/assets/<path:filename>')
+def serve_asset(filename):
+    asset, current = static_assets.resolve(filename)
+    if asset is None:
+        return render_template('404.html'), 404
+
+    encoding = request.accept_encodings.best_match([e for e in ('br', 'gzip') if e in asset.variants])
+    encoding = encoding or 'identity'
+    response = Response(asset.variants[encoding], content_type=asset.content_type)
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.set_etag(f"{asset.digest}-{encoding}")
+    if current:
+        response.headers['Cache-Control'] = f'public, max-age={ASSET_MAX_AGE}, immutable'
+    else:
+        # 舊版本的指紋網址 (部署後仍快取著舊頁面)：送出目前內容但不長期快取
+        response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+
+# ============== 公開路由（家長使用） ==============
+
+@app.route('/healthz')
+def healthz():
+    """健康檢查：不連線 Firebase，回報 worker 本身所知的 Firebase 初始化狀態
+
+    尚未使用過 Firebase (延遲初始化) 時視為正常；初始化失敗且重試仍未成功時回應 503，
+    讓平台重新啟動無法連線 Firebase 的 worker。
+    """
+    # 測試與 benchmark 會把 db 換成記憶體替身
+    firebase = db.status() if isinstance(db, LazyFirestore) else 'ok'
+    body = {'status': 'ok' if firebase in ('ok', 'not_initialized') else 'error', 'firebase': firebase}
+    if getattr(db, 'last_error', None):
+        body['error'] = db.last_error
+    return jsonify(body), 200 if body['status'] == 'ok' else 503
+
+
+@app.route('/')
+def index():
+    return render_template('index.html')
+
+
+@app.route('/submit', methods=['POST'])
+@admission_control
+def submit():
+    if not db:
+        flash('系統錯誤：資料庫未連接', 'danger')
+        return redirect(url_for('index'))
+
+    try:
+        child_name = request.form.get('child_name', '').strip()
+        parent_info = request.form.get('parent_info', '').strip()
         
-        # 處理時間 (Firestore Timestamp 轉 Python datetime)
-        if hasattr(data.get('upload_time'), 'strftime'):
-             pass # 已經是 datetime
+        if not child_name:
+            flash('請填寫孩子姓名', 'danger')
+            return redirect(url_for('index'))
+        
+        if 'file' not in request.files:
+            flash('請選擇要上傳的檔案', 'danger')
+            return redirect(url_for('index'))
+        
+        files = request.files.getlist('file')
+        
+        if not files or files[0].filename == '':
+            flash('請選擇要上傳的檔案', 'danger')
+            return redirect(url_for('index'))
+            
+        bucket = storage.bucket()
+        if not bucket:
+            flash('系統錯誤：無法連接到雲端儲存', 'danger')
+            return redirect(url_for('index'))
+            
+        success_count = 0
+        fail_count = 0
+
+        valid_files = []
+        for file in files:
+            if file.filename == '' or not allowed_file(file.filename):
+                fail_count += 1
+                continue
+            valid_files.append(file)
+        metrics.UPLOAD_FILES.labels('rejected').inc(fail_count)
+
+        # 所有檔案同時上傳到 Storage (並行數量受執行緒池限制)
+        futures = [upload_executor.submit(upload_to_storage, bucket, file) for file in valid_files]
+
+        uploaded = []
+        for future in futures:
+            try:
+                file_fields, created = future.result()
+                uploaded.append(file_fields)
+            except Exception as e:
+                print(f"單一檔案上傳失敗: {e}")
+                metrics.UPLOAD_FILES.labels('failed').inc()
+                fail_count += 1
+
+        if uploaded:
+            upload_time = datetime.utcnow()
+            records = [{
+                'child_name': child_name,
+                'parent_info': parent_info,
+                **file_fields,
+                'upload_time': upload_time,
+                'ip_address': request.remote_addr
+            } for file_fields in uploaded]
+
+            # 寫入 Firestore (一次 batch 寫入全部記錄)
+            try:
+                persist_submissions(records)
+                success_count = len(records)
+            except Exception as e:
+                print(f"寫入 Firestore 失敗: {e}")
+                metrics.UPLOAD_FILES.labels('failed').inc(len(records))
+                fail_count += len(records)
+                # 記錄寫入失敗時撤銷這次登記的引用，已無其他引用的 blob 才會被刪除，避免留下孤兒檔案
+                release_blob_refs(bucket, [file_fields['content_hash'] for file_fields in uploaded])
+
+        if success_count > 0:
+            msg = f'成功上傳 {success_count} 個檔案！感謝您的參與 🎉'
+            if fail_count > 0:
+                msg += f' (另有 {fail_count} 個檔案上傳失敗)'
+            flash(msg, 'success')
         else:
-             # 如果是字串或其他
-             pass
+            flash('檔案上傳失敗，請檢查檔案格式或大小', 'danger')
+            
+        return redirect(url_for('index'))
+        
+    except Exception as e:
+        app.logger.error(f"上傳錯誤: {str(e)}")
+        flash(f'上傳失敗: {str(e)}', 'danger')
+        return redirect(url_for('index'))
 
-        results.append(data)
 
-    # 內存分頁
-    per_page = app.config['ITEMS_PER_PAGE']
-    total_items = len(results)
-    total_pages = (total_items + per_page - 1) // per_page
-    
-    start = (page - 1) * per_page
-    end = start + per_page
-    paginated_items = results[start:end]
+# ============== 分段續傳上傳 API ==============
+#
+# 大檔案可改用分段上傳，斷線後只需補傳缺少的分段：
+#   1. POST /upload/sessions                      建立上傳工作階段
+#   2. PUT  /upload/sessions/<id>/chunks/<index>  上傳第 index 段 (可同時上傳多段)
+#   3. GET  /upload/sessions/<id>                 查詢已收到的分段與連續位移
+#   4. POST /upload/sessions/<id>/complete        在 Storage 中組合檔案並寫入 submissions
+#
+# 每個分段直接寫入 Storage 暫存物件，worker 記憶體中最多只有一個分段。
+# 未完成的暫存物件位於 upload_sessions/ 之下，建議在 Storage 設定生命週期規則定期清除。
+
+# GCS compose 單次最多組合 32 個物件
+COMPOSE_LIMIT = 32
+
+
+def upload_session_ref(session_id):
+    return db.collection('upload_sessions').document(session_id)
+
+
+def chunk_blob_name(session_id, index):
+    return f"upload_sessions/{session_id}/{index:06d}"
+
+
+def upload_session_status(session_id, data):
+    """回傳工作階段的上傳進度 (offset 為從頭開始連續收到的位元組數)"""
+    received = sorted(data.get('received_chunks', []))
+    contiguous = 0
+    while contiguous < len(received) and received[contiguous] == contiguous:
+        contiguous += 1
+    return {
+        'session_id': session_id,
+        'chunk_size': data['chunk_size'],
+        'total_chunks': data['total_chunks'],
+        'received_chunks': received,
+        'offset': min(contiguous * data['chunk_size'], data['file_size']),
+        'complete': len(received) == data['total_chunks']
+    }
+
+
+def compose_chunks(bucket, destination, sources, session_id):
+    """將分段物件組合成 destination，超過 COMPOSE_LIMIT 個時分層組合"""
+    temporary = []
+    level = 0
+    while len(sources) > COMPOSE_LIMIT:
+        grouped = []
+        for i in range(0, len(sources), COMPOSE_LIMIT):
+            part = bucket.blob(f"upload_sessions/{session_id}/compose_{level}_{i // COMPOSE_LIMIT:04d}")
+            part.content_type = destination.content_type
+            with metrics.timed('storage', 'compose'):
+                part.compose(sources[i:i + COMPOSE_LIMIT])
+            grouped.append(part)
+        temporary.extend(grouped)
+        sources = grouped
+        level += 1
+    with metrics.timed('storage', 'compose'):
+        destination.compose(sources)
+    return temporary
+
+
+@transactional
+def claim_upload_session(transaction, session_ref):
+    """將工作階段由 open 標記為 completing，避免重複完成；無法完成時回傳 None"""
+    snapshot = session_ref.get(transaction=transaction)
+    if not snapshot.exists:
+        return None
+    data = snapshot.to_dict()
+    if data.get('status') != 'open' or len(data.get('received_chunks', [])) != data['total_chunks']:
+        return None
+    transaction.update(session_ref, {'status': 'completing'})
+    return data
+
+
+@app.route('/upload/sessions', methods=['POST'])
+def create_upload_session():
+    if not db: return jsonify({'error': '系統錯誤：資料庫未連接'}), 500
+
+    payload = request.get_json(silent=True) or request.form
+    child_name = (payload.get('child_name') or '').strip()
+    parent_info = (payload.get('parent_info') or '').strip()
+    original_filename = os.path.basename((payload.get('filename') or '').strip())
+    content_type = payload.get('content_type') or 'application/octet-stream'
+
+    try:
+        file_size = int(payload.get('size', 0))
+    except (TypeError, ValueError):
+        file_size = 0
+
+    if not child_name:
+        return jsonify({'error': '請填寫孩子姓名'}), 400
+    if not original_filename or not allowed_file(original_filename):
+        metrics.UPLOAD_FILES.labels('rejected').inc()
+        return jsonify({'error': '不支援的檔案格式'}), 400
+    if file_size <= 0:
+        return jsonify({'error': '請提供檔案大小'}), 400
+    if file_size > app.config['CHUNKED_UPLOAD_MAX_SIZE']:
+        metrics.UPLOAD_FILES.labels('rejected').inc()
+        return jsonify({'error': f"檔案超過 {format_file_size(app.config['CHUNKED_UPLOAD_MAX_SIZE'])} 限制"}), 413
+
+    chunk_size = app.config['UPLOAD_CHUNK_SIZE']
+    session_ref = db.collection('upload_sessions').document()
+    session_data = {
+        'child_name': child_name,
+        'parent_info': parent_info,
+        'original_filename': original_filename,
+        'content_type': content_type,
+        'file_size': file_size,
+        'chunk_size': chunk_size,
+        'total_chunks': (file_size + chunk_size - 1) // chunk_size,
+        'received_chunks': [],
+        'status': 'open',
+        'created_at': datetime.utcnow(),
+        'ip_address': request.remote_addr
+    }
+    with metrics.timed('firestore', 'session_set'):
+        session_ref.set(session_data)
+
+    return jsonify(upload_session_status(session_ref.id, session_data)), 201
+
+
+@app.route('/upload/sessions/<session_id>', methods=['GET'])
+def get_upload_session(session_id):
+    if not db: return jsonify({'error': '系統錯誤：資料庫未連接'}), 500
+
+    with metrics.timed('firestore', 'session_get'):
+        doc = upload_session_ref(session_id).get()
+    if not doc.exists:
+        return jsonify({'error': '上傳工作階段不存在'}), 404
+
+    return jsonify(upload_session_status(session_id, doc.to_dict()))
+
+
+@app.route('/upload/sessions/<session_id>/chunks/<int:index>', methods=['PUT'])
+def upload_chunk(session_id, index):
+    if not db: return jsonify({'error': '系統錯誤：資料庫未連接'}), 500
+
+    session_ref = upload_session_ref(session_id)
+    with metrics.timed('firestore', 'session_get'):
+        doc = session_ref.get()
+    if not doc.exists:
+        return jsonify({'error': '上傳工作階段不存在'}), 404
+
+    data = doc.to_dict()
+    if data.get('status') != 'open':
+        return jsonify({'error': '上傳工作階段已結束'}), 409
+    if index >= data['total_chunks']:
+        return jsonify({'error': '分段編號超出範圍'}), 400
+
+    # 除了最後一段外，每段大小都必須等於 chunk_size
+    expected_size = min(data['chunk_size'], data['file_size'] - index * data['chunk_size'])
+    if request.content_length != expected_size:
+        return jsonify({'error': f'分段大小錯誤，應為 {expected_size} bytes'}), 400
+
+    try:
+        bucket = storage.bucket()
+        blob = bucket.blob(chunk_blob_name(session_id, index))
+        # 直接把請求內容串流寫入 Storage，不先讀進記憶體
+        with metrics.timed('storage', 'upload_chunk'):
+            blob.upload_from_file(request.stream, size=expected_size,
+                                  content_type='application/octet-stream')
+    except Exception as e:
+        print(f"分段上傳失敗 {session_id}#{index}: {e}")
+        return jsonify({'error': '分段上傳失敗，請重試'}), 502
+
+    # ArrayUnion 是原子操作，多個分段同時上傳也不會互相覆蓋
+    with metrics.timed('firestore', 'session_update'):
+        session_ref.update({'received_chunks': firestore.ArrayUnion([index])})
+
+    return jsonify({'session_id': session_id, 'index': index, 'size': expected_size})
+
+
+@app.route('/upload/sessions/<session_id>/complete', methods=['POST'])
+def complete_upload_session(session_id):
+    if not db: return jsonify({'error': '系統錯誤：資料庫未連接'}), 500
+
+    session_ref = upload_session_ref(session_id)
+    with metrics.timed('firestore', 'session_claim'):
+        data = claim_upload_session(db.transaction(), session_ref)
+    if data is None:
+        with metrics.timed('firestore', 'session_get'):
+            doc = session_ref.get()
+        if not doc.exists:
+            return jsonify({'error': '上傳工作階段不存在'}), 404
+        return jsonify({'error': '分段尚未全部上傳或工作階段已完成',
+                        **upload_session_status(session_id, doc.to_dict())}), 409
+
+    bucket = storage.bucket()
+    original_filename = data['original_filename']
+    chunk_names = [chunk_blob_name(session_id, i) for i in range(data['total_chunks'])]
+
+    # 已組合出的物件，失敗時需刪除，否則重試會組合到新的路徑而留下孤兒檔案
+    composed = []
+    try:
+        blob_name = build_blob_name(original_filename)
+        blob = bucket.blob(blob_name)
+        blob.content_type = data['content_type']
+        set_download_metadata(blob, original_filename)
+
+        temporary = compose_chunks(bucket, blob, [bucket.blob(name) for name in chunk_names], session_id)
+        composed = [blob_name] + [part.name for part in temporary]
+
+        record = {
+            'child_name': data['child_name'],
+            'parent_info': data['parent_info'],
+            'file_url': blob.public_url,
+            'storage_path': blob_name,
+            'original_filename': original_filename,
+            'file_size': data['file_size'],
+            'upload_time': datetime.utcnow(),
+            'ip_address': data.get('ip_address')
+        }
+        persist_submissions([record])
+    except Exception as e:
+        print(f"組合分段上傳失敗 {session_id}: {e}")
+        metrics.UPLOAD_FILES.labels('failed').inc()
+        if composed:
+            delete_blobs(bucket, composed)
+        # 讓用戶端可以重試完成 (分段仍保留)
+        with metrics.timed('firestore', 'session_update'):
+            session_ref.update({'status': 'open'})
+        return jsonify({'error': '檔案組合失敗，請重試'}), 502
+
+    # 清除暫存分段與工作階段
+    delete_blobs(bucket, chunk_names + [part.name for part in temporary])
+    with metrics.timed('firestore', 'session_delete'):
+        session_ref.delete()
+
+    return jsonify({
+        'success': True,
+        'original_filename': original_filename,
+        'file_size': data['file_size']
+    })
+
+
+# ============== 直傳 Storage (Signed URL) API ==============
+#
+# 檔案不經過 Flask worker，直接由瀏覽器上傳到 Storage：
+#   1. POST /upload/direct           驗證表單並取得每個檔案的限時上傳網址與 upload_token
+#   2. 用戶端以 PUT 將檔案送到 upload_url (需帶上回傳的 headers)
+#   3. POST /upload/direct/finalize  帶回 upload_token，確認檔案已上傳後寫入 submissions
+#
+# upload_token 以 SECRET_KEY 簽章，內含表單資料與 Storage 路徑，伺服器端不需保存狀態。
+# 瀏覽器直傳需要在 Bucket 設定 CORS (見 FIREBASE_SETUP.md)。
+
+def direct_upload_serializer():
+    return URLSafeTimedSerializer(app.config['SECRET_KEY'], salt='direct-upload')
+
+
+def direct_upload_document_id(storage_path):
+    """直傳檔案的 submissions 文件 ID (由 Storage 路徑決定，重複 finalize 時相同)"""
+    return hashlib.sha256(storage_path.encode('utf-8')).hexdigest()
+
+
+@app.route('/upload/direct', methods=['POST'])
+def create_direct_upload():
+    if not db: return jsonify({'error': '系統錯誤：資料庫未連接'}), 500
+
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        payload = {}
+    child_name = str(payload.get('child_name') or '').strip()
+    parent_info = str(payload.get('parent_info') or '').strip()
+    files = payload.get('files') or []
+
+    if not child_name:
+        return jsonify({'error': '請填寫孩子姓名'}), 400
+    if not isinstance(files, list) or not files:
+        return jsonify({'error': '請選擇要上傳的檔案'}), 400
+
+    max_size = app.config['DIRECT_UPLOAD_MAX_SIZE']
+    expiration = timedelta(seconds=app.config['SIGNED_URL_EXPIRATION'])
+    bucket = storage.bucket()
+    serializer = direct_upload_serializer()
+
+    uploads = []
+    for file_info in files:
+        if not isinstance(file_info, dict):
+            metrics.UPLOAD_FILES.labels('rejected').inc()
+            uploads.append({'filename': None, 'error': '檔案資訊格式錯誤 (需包含 filename、size、content_type)'})
+            continue
+        original_filename = os.path.basename(str(file_info.get('filename') or '').strip())
+        content_type = str(file_info.get('content_type') or 'application/octet-stream')
+        try:
+            file_size = int(file_info.get('size', 0))
+        except (TypeError, ValueError):
+            file_size = 0
+
+        if not original_filename or not allowed_file(original_filename):
+            metrics.UPLOAD_FILES.labels('rejected').inc()
+            uploads.append({'filename': original_filename, 'error': '不支援的檔案格式'})
+            continue
+        if file_size <= 0 or file_size > max_size:
+            metrics.UPLOAD_FILES.labels('rejected').inc()
+            uploads.append({'filename': original_filename, 'error': f'檔案大小需介於 1 byte 與 {format_file_size(max_size)} 之間'})
+            continue
+
+        blob_name = build_blob_name(original_filename)
+        # Storage 會拒絕大小超出宣告範圍的上傳
+        headers = {
+            'Content-Type': content_type,
+            'x-goog-content-length-range': f'0,{file_size}'
+        }
+        with metrics.timed('storage', 'sign_url'):
+            upload_url = bucket.blob(blob_name).generate_signed_url(
+                version='v4',
+                expiration=expiration,
+                method='PUT',
+                content_type=content_type,
+                headers={'x-goog-content-length-range': headers['x-goog-content-length-range']}
+            )
+        upload_token = serializer.dumps({
+            'child_name': child_name,
+            'parent_info': parent_info,
+            'storage_path': blob_name,
+            'original_filename': original_filename,
+            'file_size': file_size,
+            'ip_address': request.remote_addr
+        })
+        uploads.append({
+            'filename': original_filename,
+            'upload_url': upload_url,
+            'method': 'PUT',
+            'headers': headers,
+            'upload_token': upload_token
+        })
+
+    return jsonify({'uploads': uploads, 'expires_in': app.config['SIGNED_URL_EXPIRATION']})
+
+
+@app.route('/upload/direct/finalize', methods=['POST'])
+def finalize_direct_upload():
+    if not db: return jsonify({'error': '系統錯誤：資料庫未連接'}), 500
+
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        payload = {}
+    tokens = payload.get('upload_tokens') or []
+    if not isinstance(tokens, list) or not tokens:
+        return jsonify({'error': '缺少 upload_tokens'}), 400
+
+    bucket = storage.bucket()
+    serializer = direct_upload_serializer()
+    # 上傳網址過期前開始的上傳仍可能在過期後才完成，多保留一段時間
+    max_age = app.config['SIGNED_URL_EXPIRATION'] * 2
+
+    results = []
+    records = []
+    doc_ids = []
+    for token in tokens:
+        try:
+            info = serializer.loads(token, max_age=max_age)
+        except (BadSignature, TypeError):
+            results.append({'error': '無效或已過期的 upload_token'})
+            continue
+
+        result = {'filename': info['original_filename']}
+        results.append(result)
+
+        with metrics.timed('storage', 'get_blob'):
+            blob = bucket.get_blob(info['storage_path'])
+        if blob is None:
+            result['error'] = '檔案尚未上傳'
+            continue
+        if blob.size > info['file_size']:
+            with metrics.timed('storage', 'delete'):
+                blob.delete()
+            metrics.UPLOAD_FILES.labels('rejected').inc()
+            result['error'] = '檔案大小與宣告不符'
+            continue
+
+        # 同一個 token 重送時不重複建立記錄：文件 ID 由 Storage 路徑決定，
+        # 尚在日誌中或同時 finalize 的重複記錄在寫入 Firestore 時略過 (見 save_submissions)
+        doc_id = direct_upload_document_id(info['storage_path'])
+        with metrics.timed('firestore', 'get'):
+            existing = db.collection('submissions').document(doc_id).get()
+        if existing.exists:
+            result['success'] = True
+            continue
+
+        set_download_metadata(blob, info['original_filename'])
+        with metrics.timed('storage', 'patch'):
+            blob.patch()
+
+        records.append({
+            'child_name': info['child_name'],
+            'parent_info': info['parent_info'],
+            'file_url': blob.public_url,
+            'storage_path': info['storage_path'],
+            'original_filename': info['original_filename'],
+            'file_size': blob.size,
+            'upload_time': datetime.utcnow(),
+            'ip_address': info['ip_address']
+        })
+        doc_ids.append(doc_id)
+        result['success'] = True
+
+    if records:
+        try:
+            persist_submissions(records, doc_ids)
+        except Exception as e:
+            print(f"寫入 Firestore 失敗: {e}")
+            metrics.UPLOAD_FILES.labels('failed').inc(len(records))
+            return jsonify({'error': '寫入記錄失敗，請重試'}), 502
+
+    success_count = sum(1 for result in results if result.get('success'))
+    return jsonify({
+        'success_count': success_count,
+        'fail_count': len(results) - success_count,
+        'results': results
+    })
+
+
+# ============== 管理員路由 ==============
+
+@app.route('/admin/login', methods=['GET', 'POST'])
+def admin_login():
+    if current_user.is_authenticated:
+        return redirect(url_for('admin_dashboard'))
     
-    # 模擬 Pagination 物件以適配模板
-    class MockPagination:
-        def __init__(self, items, page, pages, total):
-            self.items = items
-            self.page = page
-            self.pages = pages
-            self.total = total
-            self.has_prev = page > 1
-            self.has_next = page < pages
-            self.prev_num = page - 1
-            self.next_num = page + 1
+    if request.method == 'POST':
+        username = request.form.get('username', '').strip()
+        password = request.form.get('password', '')
+        
+        if db:
+            # 查詢 Firestore
+            with metrics.timed('firestore', 'admin_lookup'):
+                docs = list(db.collection('admins').where('username', '==', username).limit(1).stream())
+            admin_doc = docs[0] if docs else None
             
-        def iter_pages(self, left_edge=1, right_edge=1, left_current=2, right_current=2):
-            # 簡單實作
-            for i in range(1, self.pages + 1):
-                yield i
+            if admin_doc:
+                data = admin_doc.to_dict()
+                if check_password_hash(data['password_hash'], password):
+                    user = AdminUser(admin_doc.id, data['username'], data['password_hash'])
+                    # 登入時已讀到最新資料，直接更新快取
+                    admin_cache.set(user.id, user)
+                    login_user(user)
+                    flash('登入成功！', 'success')
+                    return redirect(url_for('admin_dashboard'))
+        
+        flash('使用者名稱或密碼錯誤', 'danger')
+    
+    return render_template('login.html')
+
+
+@app.route('/admin/logout')
+@login_required
+def admin_logout():
+    logout_user()
+    flash('已成功登出', 'success')
+    return redirect(url_for('index'))
+
+
+class CursorPagination:
+    """以 Firestore cursor 實作的分頁物件
+
+    只讀取當頁資料 (limit + 1 筆用來判斷是否還有下一頁)，
+    成本與集合大小無關。total 為 None 時表示總筆數未知 (例如搜尋結果)。
+    """
+
+    def __init__(self, items, page, per_page, total, prev_cursor, next_cursor):
+        self.items = items
+        self.page = page
+        self.total = total
+        self.pages = (total + per_page - 1) // per_page if total is not None else None
+        self.prev_cursor = prev_cursor
+        self.next_cursor = next_cursor
+        self.has_prev = prev_cursor is not None
+        self.has_next = next_cursor is not None
+        self.prev_num = page - 1
+        self.next_num = page + 1
+
+
+def submissions_cursor_query(direction, cursor=None, search_token=None, since=None, until=None):
+    """依 (upload_time, 文件 ID) 排序的 submissions 查詢，cursor 為上一頁邊界
+
+    指定 search_token 時只查詢搜尋索引含有該 token 的文件
+    (需要 search_tokens + upload_time 的複合索引)。since / until 限制 upload_time 範圍。
+    """
+    query = db.collection('submissions')
+    if search_token:
+        query = query.where('search_tokens', 'array_contains', search_token)
+    query = apply_time_range(query, since, until)
+    query = (query
+             .order_by('upload_time', direction=direction)
+             .order_by('__name__', direction=direction))
+    if cursor:
+        upload_time, doc_id = decode_cursor(cursor)
+        query = query.start_after({'upload_time': upload_time, '__name__': doc_id})
+    return query
+
+
+def take_matching(query, limit, match=None):
+    """從查詢中取出前 limit 筆符合 match 條件的文件"""
+    if match is None:
+        with metrics.timed('firestore', 'query'):
+            return list(query.limit(limit).stream())
+
+    docs = []
+    for page in iter_query_pages(query, max(limit, app.config['ITEMS_PER_PAGE'])):
+        docs.extend(doc for doc in page if match(doc.to_dict()))
+        if len(docs) >= limit:
+            break
+    return docs[:limit]
+
+
+def fetch_submissions_page(per_page, after=None, before=None, search_tokens=None, since=None, until=None):
+    """以 keyset 分頁讀取一頁 submissions，回傳 (文件列表, 上一頁 cursor, 下一頁 cursor)
+
+    search_tokens 中最長的 token 交給 Firestore 的 array_contains 查詢，
+    其餘 token 只在索引查詢結果中比對，不會掃描整個集合。
+    """
+    search_token = None
+    match = None
+    if search_tokens:
+        search_token = max(sorted(search_tokens), key=len)
+        if len(search_tokens) > 1:
+            def match(data):
+                return search_tokens.issubset(data.get('search_tokens', []))
+
+    if before:
+        # 往前翻頁：反向排序取緊接在 cursor 之前的資料，再反轉回新到舊
+        query = submissions_cursor_query(firestore.Query.ASCENDING, before, search_token, since, until)
+        docs = take_matching(query, per_page + 1, match)
+        has_prev = len(docs) > per_page
+        docs = docs[:per_page][::-1]
+        has_next = True
+    else:
+        query = submissions_cursor_query(firestore.Query.DESCENDING, after, search_token, since, until)
+        docs = take_matching(query, per_page + 1, match)
+        has_next = len(docs) > per_page
+        docs = docs[:per_page]
+        has_prev = bool(after)
+
+    prev_cursor = encode_cursor(docs[0]) if docs and has_prev else None
+    next_cursor = encode_cursor(docs[-1]) if docs and has_next else None
+    return docs, prev_cursor, next_cursor
+
+
+def get_submission_totals():
+    """總提交數與總大小"""
+    stats = read_submission_stats()
+    return stats['count'], stats['total_size']
+
+
+def build_histogram(since, until):
+    """管理後台的提交數分布：篩選範圍只有一天時按小時，否則按日 (只讀取每日統計)"""
+    today = local_time(datetime.utcnow()).date()
+    last = local_time(until - timedelta(microseconds=1)).date() if until else today
+    if since:
+        first = local_time(since).date()
+    else:
+        first = last - timedelta(days=app.config['STATS_HISTOGRAM_DAYS'] - 1)
+    first = max(first, last - timedelta(days=app.config['STATS_HISTOGRAM_MAX_DAYS'] - 1))
+    if first > last:
+        return None
+
+    days = read_daily_stats(first, last)
+    if first == last:
+        hours = days.get(first.isoformat(), {}).get('hours', {})
+        title = f"{first.isoformat()} 每小時提交數"
+        buckets = [
+            (f"{hour:02d}:00", hours.get(f"{hour:02d}", {'count': 0, 'total_size': 0}))
+            for hour in range(24)
+        ]
+    else:
+        title = f"{first.isoformat()} ~ {last.isoformat()} 每日提交數"
+        buckets = [
+            ((first + timedelta(days=offset)).strftime('%m/%d'),
+             days.get((first + timedelta(days=offset)).isoformat(), {'count': 0, 'total_size': 0}))
+            for offset in range((last - first).days + 1)
+        ]
+
+    peak = max(values['count'] for _, values in buckets) or 1
+    return {
+        'title': title,
+        'count': sum(values['count'] for _, values in buckets),
+        'total_size': sum(values['total_size'] for _, values in buckets),
+        'buckets': [{
+            'label': label,
+            'count': values['count'],
+            'formatted_size': format_file_size(values['total_size']),
+            'percent': round(values['count'] * 100 / peak)
+        } for label, values in buckets]
+    }
+
+
+@functools.lru_cache(maxsize=None)
+def template_digest():
+    """模板內容的雜湊，部署新版模板後 ETag 隨之改變"""
+    digest = hashlib.sha256()
+    for name in sorted(app.jinja_loader.list_templates()):
+        with open(os.path.join(app.jinja_loader.searchpath[0], name), 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def conditional_on_submissions(view):
+    """以 submissions 版本支援 If-None-Match
+
+    ETag 由版本、登入者、網址、查詢參數與今天的日期 (STATS_TIMEZONE) 計算，內容沒有變動時直接回應 304，
+    不必查詢 submissions 也不必渲染頁面。有待顯示的提示訊息時不使用 ETag。
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not db or session.get('_flashes'):
+            return view(*args, **kwargs)
+
+        raw = json.dumps([
+            read_submission_stats()['version'],
+            current_user.get_id(),
+            request.path,
+            sorted(request.args.items(multi=True)),
+            template_digest(),
+            # 「今天」連結與預設的上傳數量圖表範圍隨日期改變
+            local_time(datetime.utcnow()).date().isoformat()
+        ])
+        etag = hashlib.sha256(raw.encode('utf-8')).hexdigest()[:32]
+        if request.if_none_match.contains_weak(etag):
+            response = Response(status=304)
+        else:
+            response = make_response(view(*args, **kwargs))
+            # send_file 設定的 ETag (下載全部快取檔) 供 Range 續傳比對，保留不覆寫
+            if response.status_code != 200 or response.get_etag()[0]:
+                return response
+        # 內容相同但不保證逐位元組一致 (串流打包、匯出時間等)，使用弱 ETag
+        response.set_etag(etag, weak=True)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+    return wrapper
+
+
+@app.route('/admin/dashboard')
+@login_required
+@conditional_on_submissions
+def admin_dashboard():
+    if not db:
+        flash('資料庫連接失敗', 'danger')
+        return redirect(url_for('index'))
+
+    page = request.args.get('page', 1, type=int)
+    search = request.args.get('search', '', type=str)
+    after = request.args.get('after', '', type=str)
+    before = request.args.get('before', '', type=str)
+    since_arg = request.args.get('since', '', type=str)
+    until_arg = request.args.get('until', '', type=str)
+    per_page = app.config['ITEMS_PER_PAGE']
+
+    search_tokens = search_query_tokens(search)
+    try:
+        since, until = parse_time_range(since_arg, until_arg)
+    except ValueError:
+        flash('日期格式錯誤，請使用 YYYY-MM-DD 格式', 'danger')
+        return redirect(url_for('admin_dashboard', search=search))
+
+    try:
+        if search and not search_tokens:
+            # 搜尋字串只有標點符號等無法索引的字元
+            docs, prev_cursor, next_cursor = [], None, None
+        else:
+            docs, prev_cursor, next_cursor = fetch_submissions_page(
+                per_page, after=after, before=before, search_tokens=search_tokens, since=since, until=until
+            )
+    except ValueError:
+        # cursor 格式錯誤，回到第一頁
+        return redirect(url_for('admin_dashboard', search=search, since=since_arg, until=until_arg))
+
+    results = []
+    for doc in docs:
+        data = doc.to_dict()
+        data['id'] = doc.id
+        # 格式化
+        data['formatted_size'] = format_file_size(data.get('file_size', 0))
+        results.append(data)
+
+    total_submissions, total_size = get_submission_totals()
+
+    # 搜尋 / 篩選結果總數：最多一個 token 時可用聚合查詢計算，多個 token 時未知
+    total_items = total_submissions
+    if search or since or until:
+        total_items = None
+        if search and not search_tokens:
+            total_items = 0
+        elif len(search_tokens) <= 1:
+            count_query = submissions_cursor_query(
+                firestore.Query.DESCENDING, search_token=next(iter(search_tokens), None), since=since, until=until
+            )
+            with metrics.timed('firestore', 'count'):
+                total_items = int(count_query.count(alias='count').get()[0][0].value)
 
-    pagination = MockPagination(paginated_items, page, total_pages, total_items)
+    pagination = CursorPagination(
+        results, page, per_page, total_items,
+        prev_cursor, next_cursor
+    )
     
     return render_template(
         'dashboard.html',
-        submissions=paginated_items,
+        submissions=results,
         pagination=pagination,
         search=search,
-        total_submissions=total_items,
+        since=since_arg,
+        until=until_arg,
+        today=local_time(datetime.utcnow()).date().isoformat(),
+        histogram=build_histogram(since, until),
+        total_submissions=total_submissions,
         total_size=total_size
     )
 
@@ -392,60 +2289,193 @@ def admin_delete(submission_id):
     if not db: return jsonify({'error': 'No DB'}), 500
 
     doc_ref = db.collection('submissions').document(submission_id)
-    doc = doc_ref.get()
+    # 刪除 Firestore 記錄並同步扣除統計計數器與引用次數
+    with metrics.timed('firestore', 'delete_transaction'):
+        deleted, orphaned_paths = delete_submission_records(db.transaction(), [doc_ref])
     
-    if doc.exists:
-        data = doc.to_dict()
-        # 刪除 Storage 中的檔案
-        storage_path = data.get('storage_path')
-        if storage_path:
+    if deleted:
+        # 沒有其他記錄引用時才刪除 Storage 中的檔案
+        orphaned_path = orphaned_paths.get(submission_id)
+        if orphaned_path:
+            # 縮圖與網頁版和原檔共用內容雜湊，一併刪除 (含 /admin/file 的本機快取)
+            blob_paths = [orphaned_path] + derived_paths(deleted[submission_id])
+            delete_blobs(storage.bucket(), blob_paths)
+            file_cache.discard(blob_paths)
+        notify_submissions_changed()
+        
+        flash('記錄已刪除', 'success')
+    else:
+        flash('記錄不存在', 'danger')
+        
+    return redirect(url_for('admin_dashboard'))
+
+
+@app.route('/admin/bulk-delete', methods=['POST'])
+@login_required
+def admin_bulk_delete():
+    """批次刪除：指定 ids，或以 since / until 篩選上傳時間
+
+    Firestore 記錄每個交易最多刪除 (FIRESTORE_BATCH_LIMIT - 1) // 3 筆 (166 筆)，Storage 檔案以執行緒池平行刪除，
+    JSON 請求回傳每筆記錄的處理結果，表單請求則回到管理後台顯示摘要。
+    """
+    if not db: return jsonify({'error': 'No DB'}), 500
+
+    payload = request.get_json(silent=True) if request.is_json else None
+    if payload is not None:
+        if not isinstance(payload, dict):
+            return bulk_delete_response(payload, {'error': '請求內容必須是 JSON 物件'}, 400)
+        ids = payload.get('ids') or []
+        since, until = payload.get('since'), payload.get('until')
+        if not isinstance(ids, list) or not all(isinstance(i, str) and i and '/' not in i for i in ids):
+            return bulk_delete_response(payload, {'error': 'ids 必須是記錄 ID (非空字串) 組成的陣列'}, 400)
+        if not all(value is None or isinstance(value, str) for value in (since, until)):
+            return bulk_delete_response(payload, {'error': 'since / until 必須是字串'}, 400)
+    else:
+        ids = [i for i in request.form.getlist('ids') if i and '/' not in i]
+        since, until = request.form.get('since'), request.form.get('until')
+
+    try:
+        since, until = parse_time_range(since, until)
+    except ValueError:
+        return bulk_delete_response(payload, {'error': '日期格式錯誤，請使用 YYYY-MM-DD 或 ISO 8601 格式'}, 400)
+
+    if not ids and not (since or until):
+        return bulk_delete_response(payload, {'error': '請選擇要刪除的記錄或指定日期範圍'}, 400)
+
+    submissions_ref = db.collection('submissions')
+    if ids:
+        # 去除重複 ID 並保留順序
+        id_chunks = [list(dict.fromkeys(ids))]
+    else:
+        query = apply_time_range(submissions_ref.select(['upload_time']).order_by('upload_time'), since, until)
+        id_chunks = ([doc.id for doc in docs] for docs in iter_query_pages(query, FIRESTORE_BATCH_LIMIT))
+
+    # 每筆記錄一筆刪除、最多一筆引用次數與一筆每日統計寫入
+    chunk_size = (FIRESTORE_BATCH_LIMIT - 1) // 3
+    results = {}
+    orphaned_paths = {}
+    derived = []
+    for chunk_ids in id_chunks:
+        for start in range(0, len(chunk_ids), chunk_size):
+            batch_ids = chunk_ids[start:start + chunk_size]
+            doc_refs = [submissions_ref.document(submission_id) for submission_id in batch_ids]
             try:
-                bucket = storage.bucket()
-                blob = bucket.blob(storage_path)
-                blob.delete()
+                with metrics.timed('firestore', 'delete_transaction'):
+                    deleted, orphaned = delete_submission_records(db.transaction(), doc_refs)
             except Exception as e:
-                print(f"刪除 Storage 檔案失敗: {e}")
-        
-        # 刪除 Firestore 記錄
-        doc_ref.delete()
-        flash('記錄已刪除', 'success')
+                print(f"批次刪除 Firestore 記錄失敗: {e}")
+                results.update({submission_id: {'id': submission_id, 'status': 'error'} for submission_id in batch_ids})
+                continue
+            for submission_id in batch_ids:
+                results[submission_id] = {
+                    'id': submission_id,
+                    'status': 'deleted' if submission_id in deleted else 'not_found'
+                }
+            orphaned_paths.update(orphaned)
+            derived.extend(path for submission_id in orphaned for path in derived_paths(deleted[submission_id]))
+
+    if any(result['status'] == 'deleted' for result in results.values()):
+        notify_submissions_changed()
+
+    # 記錄刪除後再平行刪除不再被引用的 Storage 檔案 (含縮圖與網頁版) 與 /admin/file 的本機快取
+    blob_paths = list(orphaned_paths.values()) + derived
+    failed_paths = delete_blobs(storage.bucket(), blob_paths) if blob_paths else set()
+    file_cache.discard(blob_paths)
+    for submission_id, path in orphaned_paths.items():
+        results[submission_id]['blob'] = 'failed' if path in failed_paths else 'deleted'
+
+    summary = {
+        'deleted': sum(1 for result in results.values() if result['status'] == 'deleted'),
+        'not_found': sum(1 for result in results.values() if result['status'] == 'not_found'),
+        'errors': sum(1 for result in results.values() if result['status'] == 'error'),
+        'blob_failures': len(failed_paths),
+        'results': list(results.values())
+    }
+    return bulk_delete_response(payload, summary)
+
+
+def bulk_delete_response(payload, summary, status=200):
+    """JSON 請求回傳結果；表單請求以提示訊息回到管理後台"""
+    if payload is not None:
+        return jsonify(summary), status
+
+    if 'error' in summary:
+        flash(summary['error'], 'danger')
     else:
-        flash('記錄不存在', 'danger')
-        
+        message = f"已刪除 {summary['deleted']} 筆記錄"
+        if summary['not_found'] or summary['errors']:
+            message += f"，{summary['not_found'] + summary['errors']} 筆未刪除"
+        if summary['blob_failures']:
+            message += f"，{summary['blob_failures']} 個檔案刪除失敗"
+        flash(message, 'success' if summary['deleted'] else 'warning')
     return redirect(url_for('admin_dashboard'))
 
 
+# CSV 匯出欄位 (Firestore 只回傳這些欄位)
+EXPORT_FIELDS = ['child_name', 'parent_info', 'original_filename', 'file_size', 'upload_time', 'ip_address']
+
+
+def generate_csv_export(query):
+    """逐頁讀取 submissions 並分段輸出 CSV，每讀完一頁就送出一段"""
+    import csv
+
+    output = StringIO()
+    writer = csv.writer(output)
+    writer.writerow(['孩子姓名', '家長資訊', '檔案名稱', '檔案連結', '檔案大小(Bytes)', '上傳時間', 'IP位址'])
+
+    for docs in iter_query_pages(query, app.config['EXPORT_PAGE_SIZE']):
+        for doc in docs:
+            data = doc.to_dict()
+            upload_time = data.get('upload_time')
+            if hasattr(upload_time, 'strftime'):
+                upload_time = upload_time.strftime('%Y-%m-%d %H:%M:%S')
+
+            writer.writerow([
+                data.get('child_name'),
+                data.get('parent_info'),
+                data.get('original_filename'),
+                url_for('admin_file', submission_id=doc.id, _external=True),
+                data.get('file_size'),
+                upload_time,
+                data.get('ip_address')
+            ])
+
+        yield output.getvalue()
+        output.seek(0)
+        output.truncate()
+
+    # 沒有任何資料時仍要送出標題列
+    if output.tell():
+        yield output.getvalue()
+
+
+def count_export_bytes(chunks, export_format, source):
+    """邊送出邊累計匯出的位元組數"""
+    metrics.EXPORTS.labels(export_format, source).inc()
+    sent = metrics.EXPORT_BYTES.labels(export_format, source)
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        sent.inc(len(chunk))
+        yield chunk
+
+
 @app.route('/admin/export')
 @login_required
+@conditional_on_submissions
 def admin_export():
     if not db: return "Database error", 500
-    
-    submissions = db.collection('submissions').order_by('upload_time', direction=firestore.Query.DESCENDING).stream()
-    
-    output = StringIO()
-    writer = csv.writer(output)
-    writer.writerow(['孩子姓名', '家長資訊', '檔案名稱', '檔案連結', '檔案大小(Bytes)', '上傳時間', 'IP位址'])
-    
-    for doc in submissions:
-        data = doc.to_dict()
-        upload_time = data.get('upload_time')
-        if hasattr(upload_time, 'strftime'):
-            upload_time = upload_time.strftime('%Y-%m-%d %H:%M:%S')
-            
-        writer.writerow([
-            data.get('child_name'),
-            data.get('parent_info'),
-            data.get('original_filename'),
-            data.get('file_url'),
-            data.get('file_size'),
-            upload_time,
-            data.get('ip_address')
-        ])
-    
-    output.seek(0)
-    from flask import Response
+
+    try:
+        since, until = parse_time_range(request.args.get('since'), request.args.get('until'))
+    except ValueError:
+        return "日期格式錯誤，請使用 YYYY-MM-DD 或 ISO 8601 格式", 400
+
+    query = db.collection('submissions').select(EXPORT_FIELDS).order_by('upload_time', direction=firestore.Query.DESCENDING)
+    query = apply_time_range(query, since, until)
+
     return Response(
-        output.getvalue(),
+        count_export_bytes(stream_with_context(generate_csv_export(query)), 'csv', 'stream'),
         mimetype='text/csv',
         headers={
             'Content-Disposition': f'attachment; filename=submissions_{datetime.now().strftime("%Y%m%d")}.csv'
@@ -453,61 +2483,533 @@ def admin_export():
     )
 
 
-@app.route('/admin/download-all')
+# 增量匯出的欄位，依序對應 Parquet 欄位型別
+SNAPSHOT_FIELDS = {
+    'child_name': 'string',
+    'parent_info': 'string',
+    'original_filename': 'string',
+    'storage_path': 'string',
+    'content_hash': 'string',
+    'file_size': 'int64',
+    'upload_time': 'timestamp',
+    'ip_address': 'string',
+    'thumbnail_path': 'string',
+    'web_path': 'string',
+    'web_size': 'int64',
+}
+
+SNAPSHOT_FORMATS = {'jsonl': 'application/x-ndjson', 'parquet': 'application/vnd.apache.parquet'}
+
+
+def snapshot_row(doc):
+    """將 submission 文件轉為匯出列，upload_time 一律為 UTC"""
+    data = doc.to_dict()
+    row = {'id': doc.id}
+    for field in SNAPSHOT_FIELDS:
+        row[field] = data.get(field)
+    upload_time = row['upload_time']
+    if upload_time is not None and upload_time.tzinfo is None:
+        row['upload_time'] = upload_time.replace(tzinfo=timezone.utc)
+    return row
+
+
+def fetch_snapshot_batch(watermark=None, limit=None):
+    """讀取 watermark 之後的一批記錄，回傳 (匯出列, 下一個 watermark, 是否還有更多)
+
+    依 (upload_time, 文件 ID) 由舊到新排序，watermark 與管理後台的分頁 cursor 格式相同；
+    沒有新記錄時下一個 watermark 與原本相同。
+
+    記錄在 upload_time 之後才寫入 Firestore (write-behind 日誌) 時，可能落在已匯出的 watermark 之前而永遠被略過，
+    因此只匯出 EXPORT_SNAPSHOT_LAG 秒以前的記錄，且不超過本機日誌中最早一筆尚未寫入的記錄。
+    限制：其他主機上 worker 的日誌無法得知，這些日誌積壓超過 EXPORT_SNAPSHOT_LAG 時仍可能漏掉記錄。
+    """
+    limit = limit or app.config['EXPORT_SNAPSHOT_BATCH_SIZE']
+    settled = datetime.utcnow() - timedelta(seconds=app.config['EXPORT_SNAPSHOT_LAG'])
+    if submission_journal is not None:
+        oldest_pending = submission_journal.oldest_pending_upload_time()
+        if oldest_pending is not None and oldest_pending < settled:
+            settled = oldest_pending
+    query = submissions_cursor_query(firestore.Query.ASCENDING, watermark, until=settled)
+    with metrics.timed('firestore', 'query'):
+        docs = list(query.select(list(SNAPSHOT_FIELDS)).limit(limit + 1).stream())
+    has_more = len(docs) > limit
+    docs = docs[:limit]
+    next_watermark = encode_cursor(docs[-1]) if docs else watermark
+    return [snapshot_row(doc) for doc in docs], next_watermark, has_more
+
+
+def encode_snapshot_batch(rows, export_format):
+    """將一批匯出列編碼為 JSONL 或 Parquet (需要 pyarrow)"""
+    if export_format == 'parquet':
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        types = {'string': pa.string(), 'int64': pa.int64(), 'timestamp': pa.timestamp('us', tz='UTC')}
+        schema = pa.schema(
+            [('id', pa.string())] + [(field, types[kind]) for field, kind in SNAPSHOT_FIELDS.items()]
+        )
+        table = pa.Table.from_pylist(rows, schema=schema)
+        buffer = BytesIO()
+        pq.write_table(table, buffer, compression='zstd')
+        return buffer.getvalue()
+
+    lines = []
+    for row in rows:
+        if row['upload_time'] is not None:
+            row = {**row, 'upload_time': row['upload_time'].isoformat()}
+        lines.append(json.dumps(row, ensure_ascii=False) + '\n')
+    return ''.join(lines).encode('utf-8')
+
+
+@app.route('/admin/export/snapshot')
 @login_required
-def admin_download_all():
-    """下載所有檔案並打包成 ZIP"""
+def admin_export_snapshot():
+    """增量匯出：回傳 ?after= watermark 之後的一批記錄
+
+    ?format=jsonl (預設) 或 parquet，?limit= 不可超過 EXPORT_SNAPSHOT_BATCH_SIZE。
+    下一次請求的 watermark 放在 X-Next-Watermark，X-Has-More 為 1 時應立即再取下一批。
+    """
     if not db: return "Database error", 500
-    
+
+    export_format = request.args.get('format', 'jsonl')
+    if export_format not in SNAPSHOT_FORMATS:
+        return f"不支援的匯出格式: {export_format}", 400
+    batch_size = app.config['EXPORT_SNAPSHOT_BATCH_SIZE']
+    limit = min(max(request.args.get('limit', batch_size, type=int), 1), batch_size)
+
     try:
-        bucket = storage.bucket()
-        submissions = db.collection('submissions').stream()
-        
-        # 建立記憶體中的 ZIP
-        memory_file = BytesIO()
-        with zipfile.ZipFile(memory_file, 'w', zipfile.ZIP_DEFLATED) as zf:
-            
-            # 用來處理重名檔案的計數器
-            filename_counter = {}
-            
-            for doc in submissions:
-                data = doc.to_dict()
-                storage_path = data.get('storage_path')
-                original_filename = data.get('original_filename', 'unknown')
-                child_name = data.get('child_name', 'unknown')
-                
-                # 建構 ZIP 內的檔名：孩子姓名_原始檔名
-                # 移除非法字元
-                safe_child_name = "".join([c for c in child_name if c.isalnum() or c in (' ', '-', '_')]).strip()
-                zip_filename = f"{safe_child_name}_{original_filename}"
-                
-                # 處理重名
-                if zip_filename in filename_counter:
-                    filename_counter[zip_filename] += 1
-                    name, ext = os.path.splitext(zip_filename)
-                    zip_filename = f"{name}_{filename_counter[zip_filename]}{ext}"
-                else:
-                    filename_counter[zip_filename] = 0
-                
-                if storage_path:
+        rows, next_watermark, has_more = fetch_snapshot_batch(request.args.get('after') or None, limit)
+    except ValueError:
+        return "無效的 watermark", 400
+    try:
+        body = encode_snapshot_batch(rows, export_format)
+    except ImportError:
+        return "伺服器未安裝 pyarrow，無法匯出 Parquet", 501
+
+    response = Response(
+        count_export_bytes([body], export_format, 'snapshot'),
+        mimetype=SNAPSHOT_FORMATS[export_format]
+    )
+    response.headers['X-Next-Watermark'] = next_watermark or ''
+    response.headers['X-Has-More'] = '1' if has_more else '0'
+    response.headers['X-Record-Count'] = str(len(rows))
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+
+def zip_entry_name(data, used_names):
+    """ZIP 內檔名：孩子姓名_原始檔名，與 used_names 重名時加上編號"""
+    original_filename = data.get('original_filename', 'unknown')
+    child_name = data.get('child_name', 'unknown')
+
+    # 移除非法字元
+    safe_child_name = "".join([c for c in child_name if c.isalnum() or c in (' ', '-', '_')]).strip()
+    zip_filename = f"{safe_child_name}_{original_filename}"
+
+    # 處理重名
+    name, ext = os.path.splitext(zip_filename)
+    counter = 0
+    while zip_filename in used_names:
+        counter += 1
+        zip_filename = f"{name}_{counter}{ext}"
+    used_names.add(zip_filename)
+    return zip_filename
+
+
+def iter_zip_entries(records):
+    """依 submissions 記錄產生 (ZIP 內檔名, storage_path)，並處理重名檔案"""
+    used_names = set()
+    for data in records:
+        storage_path = data.get('storage_path')
+        if storage_path:
+            yield zip_entry_name(data, used_names), storage_path
+
+
+def zip_compress_type(zip_filename):
+    """已壓縮過的格式 (圖片、壓縮檔、Office 文件) 直接儲存，不再浪費 CPU 壓縮"""
+    import zipfile
+
+    ext = os.path.splitext(zip_filename)[1].lstrip('.').lower()
+    return zipfile.ZIP_STORED if ext in app.config['ZIP_STORED_EXTENSIONS'] else zipfile.ZIP_DEFLATED
+
+
+def open_blob_stream(bucket, storage_path):
+    """開啟 blob 的串流讀取並先讀取第一段，回傳 (檔案大小, 第一段內容, reader)"""
+    chunk_size = app.config['ZIP_CHUNK_SIZE']
+    with metrics.timed('storage', 'download'):
+        blob = bucket.get_blob(storage_path)
+        if blob is None:
+            raise FileNotFoundError(f"Storage 檔案不存在: {storage_path}")
+        reader = blob.open('rb', chunk_size=chunk_size)
+        try:
+            first_chunk = reader.read(chunk_size)
+        except BaseException:
+            reader.close()
+            raise
+    return blob.size, first_chunk, reader
+
+
+def prefetch_blobs(bucket, entries):
+    """依序產生 (ZIP 內檔名, storage_path, future)，future 的結果為 open_blob_stream 的回傳值
+
+    同時預先開啟接下來 ZIP_PREFETCH 個檔案並讀取第一段以隱藏 Storage 延遲，
+    記憶體用量只與預先讀取的段數有關，與檔案大小無關。
+    """
+    prefetch = app.config['ZIP_PREFETCH']
+    entries = iter(entries)
+    pending = deque()
+    pool = ThreadPoolExecutor(max_workers=prefetch, thread_name_prefix='zip-prefetch')
+
+    def fill():
+        while len(pending) < prefetch:
+            entry = next(entries, None)
+            if entry is None:
+                return
+            zip_filename, storage_path = entry
+            future = pool.submit(open_blob_stream, bucket, storage_path)
+            pending.append((zip_filename, storage_path, future))
+
+    try:
+        fill()
+        while pending:
+            entry = pending.popleft()
+            fill()
+            yield entry
+    finally:
+        # 中途停止時，取消尚未開始的預先讀取，已開啟的 reader 在讀取完第一段後關閉
+        pool.shutdown(wait=False, cancel_futures=True)
+        for _, _, future in pending:
+            future.add_done_callback(close_blob_stream)
+
+
+def close_blob_stream(future):
+    if not future.cancelled() and future.exception() is None:
+        future.result()[2].close()
+
+
+def write_zip_entry(zf, zip_filename, blob_stream):
+    """將 open_blob_stream 的結果逐段寫入 ZIP，每寫入一段 yield 一次讓呼叫端送出已產生的位元組"""
+    import zipfile
+
+    chunk_size = app.config['ZIP_CHUNK_SIZE']
+    size, chunk, reader = blob_stream
+    info = zipfile.ZipInfo(zip_filename, date_time=time.localtime(time.time())[:6])
+    info.compress_type = zip_compress_type(zip_filename)
+    info.external_attr = 0o600 << 16
+    # 預先填入檔案大小，超過 4GB 時 zipfile 會自動改用 ZIP64
+    info.file_size = size or 0
+    with reader, zf.open(info, 'w') as dst:
+        while chunk:
+            dst.write(chunk)
+            yield
+            chunk = reader.read(chunk_size)
+
+
+class ZipStreamBuffer:
+    """只寫、不可 seek 的緩衝區
+
+    zipfile 寫入不可 seek 的檔案時會改用 data descriptor，
+    因此每寫完一個檔案就能把已產生的位元組送出，不必等整個 ZIP 完成。
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def generate_zip_stream(bucket, entries):
+    """邊下載邊輸出 ZIP，記憶體用量與 ZIP 總大小無關"""
+    import zipfile
+
+    buffer = ZipStreamBuffer()
+    blobs = prefetch_blobs(bucket, entries)
+
+    try:
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zf:
+            for zip_filename, storage_path, future in blobs:
+                try:
+                    # 每寫入一段就送出，記憶體用量與單一檔案大小無關
+                    for _ in write_zip_entry(zf, zip_filename, future.result()):
+                        data = buffer.drain()
+                        if data:
+                            yield data
+                except Exception as e:
+                    print(f"下載檔案失敗 {storage_path}: {e}")
+                    # 可以選擇寫入一個錯誤文字檔到 ZIP 中
+                    zf.writestr(f"ERROR_{zip_filename}.txt", f"Download failed: {str(e)}")
+                yield buffer.drain()
+        # 寫出 central directory
+        yield buffer.drain()
+    finally:
+        # 用戶端中斷下載時，取消尚未開始的預先下載
+        blobs.close()
+
+
+# 打包時只讀取這些欄位
+ARCHIVE_FIELDS = ['child_name', 'original_filename', 'storage_path', 'web_path', 'upload_time']
+
+# 下載全部的版本：original 為原始檔案，compressed 以網頁版取代已產生網頁版的圖片
+ARCHIVE_VARIANTS = ('original', 'compressed')
+
+
+def list_archive_records(variant='original', since=None, until=None):
+    """依上傳時間列出要打包的記錄 {submission_id: data}"""
+    query = db.collection('submissions').select(ARCHIVE_FIELDS).order_by('upload_time')
+    query = apply_time_range(query, since, until)
+    records = {}
+    for docs in iter_query_pages(query, app.config['EXPORT_PAGE_SIZE']):
+        for doc in docs:
+            data = doc.to_dict()
+            if not data.get('storage_path'):
+                continue
+            if variant == 'compressed' and data.get('web_path'):
+                data['storage_path'] = data['web_path']
+                data['original_filename'] = os.path.splitext(data.get('original_filename') or 'file')[0] + '.jpg'
+            records[doc.id] = data
+    return records
+
+
+def archive_key(records):
+    """以記錄 ID 與 storage_path 計算記錄集合的識別碼"""
+    digest = hashlib.sha256()
+    for submission_id in sorted(records):
+        digest.update(f"{submission_id}\0{records[submission_id]['storage_path']}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+
+class ArchiveCache:
+    """下載全部 ZIP 的本機快取
+
+    manifest 記錄建立快取時的記錄集合 (key)、submissions 版本與每筆記錄在 ZIP 內的檔名。
+    有新記錄時只下載新增的檔案附加到 ZIP 後面；有記錄被刪除時，
+    從舊的快取複製仍存在的項目重建，不必重新向 Storage 下載。
+    新的 ZIP 先寫入暫存檔再以 os.replace 取代，正在下載舊檔的請求不受影響。
+    下載失敗的檔案與串流打包相同，以 ERROR_ 文字檔代替並在 manifest 中標記，
+    下次記錄變動而更新快取時再重試，不會讓整個快取無法建立。
+    """
+
+    def __init__(self, directory, delay, variant='original'):
+        self.directory = directory
+        self.delay = delay
+        self.variant = variant
+        self.zip_path = os.path.join(directory, 'all_files.zip')
+        self.manifest_path = os.path.join(directory, 'manifest.json')
+        self._pending = threading.Event()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+
+    def load_manifest(self):
+        try:
+            with open(self.manifest_path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @property
+    def built(self):
+        return os.path.exists(self.manifest_path)
+
+    def lookup(self, key=None, version=None):
+        """快取內容與 key 代表的記錄集合 (或 submissions 版本) 一致時回傳 ZIP 路徑，否則回傳 None
+
+        版本相同時記錄一定沒有變動，可以不必列出所有記錄計算 key。
+        """
+        manifest = self.load_manifest()
+        if not manifest or not os.path.exists(self.zip_path):
+            return None
+        if key is not None and manifest.get('key') == key:
+            return self.zip_path
+        if version is not None and manifest.get('version') == version:
+            return self.zip_path
+        return None
+
+    def schedule_refresh(self):
+        """在背景更新快取，短時間內多次觸發只會更新一次"""
+        self._pending.set()
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='archive-cache', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._pending.wait()
+            # 等待連續上傳告一段落再更新
+            time.sleep(self.delay)
+            self._pending.clear()
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"更新下載全部快取失敗: {e}")
+
+    def refresh(self):
+        """將快取更新為目前的記錄集合，回傳 (新增數, 移除數)"""
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, '.lock'), 'w') as lock_file:
+            # 多個 worker 行程共用同一份快取，以檔案鎖避免同時重建
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            return self._refresh()
+
+    def _refresh(self):
+        import zipfile
+
+        # 先讀版本再列出記錄：期間有變動時 manifest 的版本較舊，只會讓 lookup 改用 key 比對
+        version = read_submission_stats()['version']
+        records = list_archive_records(self.variant)
+        key = archive_key(records)
+        manifest = self.load_manifest() if os.path.exists(self.zip_path) else None
+        if manifest and manifest.get('key') == key:
+            if manifest.get('version') != version:
+                self._write_manifest({**manifest, 'version': version})
+            return 0, 0
+
+        cached = manifest['entries'] if manifest else {}
+        kept = {
+            submission_id: entry for submission_id, entry in cached.items()
+            if submission_id in records and records[submission_id]['storage_path'] == entry[1]
+            # 上次下載失敗的項目 (第三欄為 True) 重新下載
+            and not entry[2:]
+        }
+        used_names = {entry[0] for entry in kept.values()}
+        added = {
+            submission_id: [zip_entry_name(data, used_names), data['storage_path']]
+            for submission_id, data in records.items() if submission_id not in kept
+        }
+        removed = len(cached) - len(kept)
+
+        tmp_path = self.zip_path + '.tmp'
+        try:
+            if cached and not removed:
+                # 只有新增：複製舊檔後附加新項目
+                shutil.copyfile(self.zip_path, tmp_path)
+                mode = 'a'
+            else:
+                mode = 'w'
+            with zipfile.ZipFile(tmp_path, mode, zipfile.ZIP_DEFLATED) as zf:
+                if mode == 'w' and kept:
+                    # 有刪除：從舊檔複製仍存在的項目，不重新下載
+                    kept_names = used_names.copy()
+                    with zipfile.ZipFile(self.zip_path) as old:
+                        for info in old.infolist():
+                            if info.filename in kept_names:
+                                with old.open(info) as src, zf.open(info, 'w') as dst:
+                                    shutil.copyfileobj(src, dst)
+                blobs = prefetch_blobs(storage.bucket(), added.values())
+                for submission_id, (zip_filename, storage_path, future) in zip(list(added), blobs):
                     try:
-                        blob = bucket.blob(storage_path)
-                        # 下載檔案內容到記憶體
-                        file_content = blob.download_as_bytes()
-                        # 寫入 ZIP
-                        zf.writestr(zip_filename, file_content)
+                        for _ in write_zip_entry(zf, zip_filename, future.result()):
+                            pass
                     except Exception as e:
                         print(f"下載檔案失敗 {storage_path}: {e}")
-                        # 可以選擇寫入一個錯誤文字檔到 ZIP 中
-                        zf.writestr(f"ERROR_{zip_filename}.txt", f"Download failed: {str(e)}")
+                        error_name = f"ERROR_{zip_filename}.txt"
+                        zf.writestr(error_name, f"Download failed: {str(e)}")
+                        added[submission_id] = [error_name, storage_path, True]
 
-        memory_file.seek(0)
-        
-        return send_file(
-            memory_file,
+            with open(self.manifest_path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump({'key': key, 'version': version, 'entries': {**kept, **added}}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.zip_path)
+            os.replace(self.manifest_path + '.tmp', self.manifest_path)
+        except BaseException:
+            for path in (tmp_path, self.manifest_path + '.tmp'):
+                if os.path.exists(path):
+                    os.remove(path)
+            raise
+        return len(added), removed
+
+    def _write_manifest(self, manifest):
+        with open(self.manifest_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(self.manifest_path + '.tmp', self.manifest_path)
+
+
+archive_caches = {
+    variant: ArchiveCache(
+        os.path.join(app.config['ARCHIVE_CACHE_DIR'], variant), app.config['ARCHIVE_REFRESH_DELAY'], variant
+    )
+    for variant in ARCHIVE_VARIANTS
+}
+
+
+def schedule_archive_refresh():
+    """記錄有變動時在背景更新下載全部快取
+
+    壓縮版只在曾經被下載過 (已有快取) 時才更新，避免替沒人使用的版本下載所有檔案。
+    """
+    for variant, cache in archive_caches.items():
+        if variant == 'original' or cache.built:
+            cache.schedule_refresh()
+
+
+@app.route('/admin/download-all')
+@login_required
+@conditional_on_submissions
+def admin_download_all():
+    """下載所有檔案的 ZIP
+
+    快取與目前記錄一致時直接送出快取檔 (支援 Range 續傳)，
+    否則邊下載邊串流打包，並在背景更新快取。
+    ?variant=compressed 時圖片改用縮小後的網頁版。
+    指定 since / until 時只打包該時段的檔案 (直接串流，不使用快取)。
+    """
+    if not db: return "Database error", 500
+
+    variant = request.args.get('variant', 'original')
+    if variant not in archive_caches:
+        return "Unknown variant", 400
+    archive_cache = archive_caches[variant]
+
+    try:
+        since, until = parse_time_range(request.args.get('since'), request.args.get('until'))
+    except ValueError:
+        return "日期格式錯誤，請使用 YYYY-MM-DD 或 ISO 8601 格式", 400
+    filtered = bool(since or until)
+    
+    try:
+        suffix = '_compressed' if variant == 'compressed' else ''
+        download_name = f'all_files{suffix}_{datetime.now().strftime("%Y%m%d_%H%M")}.zip'
+
+        records = None
+        cached_path = None
+        if not filtered:
+            # submissions 版本與快取相同時不必列出所有記錄
+            cached_path = archive_cache.lookup(version=read_submission_stats()['version'])
+        if not cached_path:
+            records = list_archive_records(variant, since, until)
+            cached_path = None if filtered else archive_cache.lookup(archive_key(records))
+        if cached_path:
+            response = send_file(
+                cached_path,
+                mimetype='application/zip',
+                as_attachment=True,
+                download_name=download_name,
+                conditional=True,
+                max_age=0
+            )
+            metrics.EXPORTS.labels('zip', 'cache').inc()
+            metrics.EXPORT_BYTES.labels('zip', 'cache').inc(response.content_length or 0)
+            return response
+
+        if not filtered:
+            archive_cache.schedule_refresh()
+        bucket = storage.bucket()
+        return Response(
+            count_export_bytes(generate_zip_stream(bucket, iter_zip_entries(records.values())), 'zip', 'stream'),
             mimetype='application/zip',
-            as_attachment=True,
-            download_name=f'all_files_{datetime.now().strftime("%Y%m%d_%H%M")}.zip'
+            headers={
+                'Content-Disposition': f'attachment; filename={download_name}'
+            }
         )
         
     except Exception as e:
@@ -515,6 +3017,417 @@ def admin_download_all():
         flash(f'打包下載失敗: {str(e)}', 'danger')
         return redirect(url_for('admin_dashboard'))
 
+# ============== 管理員檔案代理 ==============
+#
+# 上傳的檔案不再公開，管理員經由 /admin/file/<submission_id> 讀取。
+# 讀過的檔案保存在本機磁碟快取，重複開啟或在大型 PDF / 影片中跳轉 (Range) 時不必再向 Storage 下載。
+
+
+class FileCache:
+    """Storage 檔案的本機磁碟快取，超過容量時淘汰最久未使用的檔案
+
+    以 storage_path 的雜湊命名；內容定址或帶時間戳記的路徑內容都不會改變，快取不需失效。
+    命中時更新檔案的 mtime 作為最近使用時間，多個 worker 行程共用同一個目錄。
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        # 同一個檔案同時只下載一次 (依雜湊分配到固定數量的鎖)
+        self._fill_locks = [threading.Lock() for _ in range(64)]
+
+    def path_for(self, storage_path):
+        return os.path.join(self.directory, hashlib.sha256(storage_path.encode('utf-8')).hexdigest())
+
+    def _touch(self, path):
+        try:
+            os.utime(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def get(self, bucket, storage_path):
+        """回傳 (本機檔案路徑, 是否命中)，沒有快取時先從 Storage 下載"""
+        path = self.path_for(storage_path)
+        if self._touch(path):
+            return path, True
+        with self._fill_locks[int(os.path.basename(path)[:8], 16) % len(self._fill_locks)]:
+            if self._touch(path):
+                return path, True
+            os.makedirs(self.directory, exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                with metrics.timed('storage', 'download'):
+                    bucket.blob(storage_path).download_to_filename(tmp_path)
+                os.replace(tmp_path, path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+        self.evict(keep=path)
+        return path, False
+
+    def usage(self):
+        """回傳 [(mtime, 大小, 路徑)] 與總大小"""
+        entries = []
+        if not os.path.isdir(self.directory):
+            return entries, 0
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith('.tmp'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries, sum(size for _, size, _ in entries)
+
+    def discard(self, storage_paths):
+        """刪除已不存在於 Storage 的檔案快取 (記錄刪除時呼叫，只處理本機的快取目錄)"""
+        for storage_path in storage_paths:
+            try:
+                os.remove(self.path_for(storage_path))
+            except FileNotFoundError:
+                pass
+
+    def evict(self, keep=None):
+        """總大小超過上限時，從最久未使用的檔案開始刪除，回傳刪除的檔案數"""
+        entries, total = self.usage()
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        return removed
+
+
+file_cache = FileCache(app.config['FILE_CACHE_DIR'], app.config['FILE_CACHE_MAX_BYTES'])
+metrics.Gauge('file_cache_bytes', '/admin/file 本機快取佔用的位元組數', function=lambda: file_cache.usage()[1])
+
+# /admin/file 的 variant 參數對應的欄位
+FILE_VARIANT_FIELDS = {'original': 'storage_path', 'thumbnail': 'thumbnail_path', 'web': 'web_path'}
+
+
+@app.route('/admin/file/<submission_id>')
+@login_required
+def admin_file(submission_id):
+    """讀取上傳的檔案 (支援 Range 續傳與條件式請求)
+
+    ?variant=thumbnail / web 讀取縮圖或網頁版，?download=1 以附件下載。
+    """
+    if not db: return "Database error", 500
+
+    with metrics.timed('firestore', 'get'):
+        snapshot = db.collection('submissions').document(submission_id).get()
+    variant = request.args.get('variant', 'original')
+    data = snapshot.to_dict() if snapshot.exists else {}
+    storage_path = data.get(FILE_VARIANT_FIELDS.get(variant, ''))
+    if not storage_path:
+        return render_template('404.html'), 404
+
+    filename = data.get('original_filename') or 'file'
+    if variant != 'original':
+        filename = os.path.splitext(filename)[0] + '.jpg'
+    bucket = storage.bucket()
+
+    size = data.get('file_size', 0) if variant == 'original' else data.get('web_size', 0)
+    if size > app.config['FILE_CACHE_MAX_FILE_BYTES']:
+        # 太大的檔案不佔用快取，改以短期簽名網址直接從 Storage 下載
+        metrics.FILE_CACHE_REQUESTS.labels('redirect').inc()
+        with metrics.timed('storage', 'sign_url'):
+            url = bucket.blob(storage_path).generate_signed_url(
+                version='v4',
+                expiration=timedelta(seconds=app.config['SIGNED_URL_EXPIRATION']),
+                method='GET'
+            )
+        return redirect(url)
+
+    try:
+        path, hit = file_cache.get(bucket, storage_path)
+    except Exception as e:
+        print(f"讀取 Storage 檔案失敗 {storage_path}: {e}")
+        with metrics.timed('storage', 'exists'):
+            missing = not bucket.blob(storage_path).exists()
+        if missing:
+            return render_template('404.html'), 404
+        return "無法讀取檔案，請稍後再試", 502
+    metrics.FILE_CACHE_REQUESTS.labels('hit' if hit else 'miss').inc()
+
+    response = send_file(
+        path,
+        mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream',
+        as_attachment=bool(request.args.get('download')),
+        download_name=filename,
+        conditional=True,
+        # 快取檔的 mtime 用來記錄最近使用時間，ETag / Last-Modified 改由記錄決定
+        etag=hashlib.sha256(storage_path.encode('utf-8')).hexdigest()[:32],
+        last_modified=data.get('upload_time'),
+        max_age=3600
+    )
+    # 需要登入才能讀取，只允許瀏覽器自己快取
+    response.cache_control.public = False
+    response.cache_control.private = True
+    return response
+
+
+# ============== 效能指標 ==============
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def record_request_latency(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        # 以路由規則而非實際網址作為標籤，避免 ID 造成標籤數量暴增
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.REQUEST_SECONDS.labels(request.method, route, response.status_code).observe(
+            time.perf_counter() - started
+        )
+    return response
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus 格式的效能指標
+
+    設定 METRICS_TOKEN 時以 Authorization: Bearer <token> 驗證 (供監控系統抓取)，
+    否則需登入管理員。
+    """
+    token = app.config['METRICS_TOKEN']
+    if token:
+        if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            return jsonify({'error': 'Unauthorized'}), 401
+    elif not current_user.is_authenticated:
+        return login_manager.unauthorized()
+
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+# ============== 管理指令 ==============
+
+@app.cli.command('reconcile-stats')
+def reconcile_stats_command():
+    """重新掃描 submissions 並重建統計計數器、每日統計與 blob 引用次數 (flask reconcile-stats)
+
+    計數器平常由 submit / delete 增量維護，若因中斷或手動修改資料而不準確，
+    可在非上傳時段執行此指令重建。
+    """
+    if not db:
+        print("❌ 資料庫未連接")
+        return
+
+    # 日誌中尚未寫入 Firestore 的記錄已在上傳時登記 blob 引用次數，重建時也要計入，
+    # 否則寫入後再刪除共用同一檔案的記錄會提早刪掉檔案。掃描前先讀取，掃描期間才寫入的記錄以文件 ID 排除
+    pending_hashes = {}
+    if submission_journal is not None:
+        pending_hashes = {
+            entry['id']: entry['record']['content_hash']
+            for entry in submission_journal.pending_entries() if entry['record'].get('content_hash')
+        }
+
+    total_submissions = 0
+    total_size = 0
+    ref_counts = {}
+    days = {}
+    query = db.collection('submissions').select(['file_size', 'content_hash', 'upload_time']).order_by('__name__')
+    for docs in iter_query_pages(query, FIRESTORE_BATCH_LIMIT):
+        for doc in docs:
+            pending_hashes.pop(doc.id, None)
+            data = doc.to_dict()
+            total_submissions += 1
+            total_size += data.get('file_size', 0)
+            if data.get('content_hash'):
+                ref_counts[data['content_hash']] = ref_counts.get(data['content_hash'], 0) + 1
+            if hasattr(data.get('upload_time'), 'astimezone'):
+                upload_time = local_time(data['upload_time'])
+                hours = days.setdefault(upload_time.strftime('%Y-%m-%d'), {})
+                bucket = hours.setdefault(upload_time.strftime('%H'), {'count': 0, 'total_size': 0})
+                bucket['count'] += 1
+                bucket['total_size'] += data.get('file_size', 0)
+
+    for content_hash in pending_hashes.values():
+        ref_counts[content_hash] = ref_counts.get(content_hash, 0) + 1
+
+    # 重寫 blob 引用次數，移除已無引用的記錄
+    with metrics.timed('firestore', 'list_documents'):
+        ref_docs = list(db.collection('blob_refs').list_documents())
+    for ref_doc in ref_docs:
+        ref_counts.setdefault(ref_doc.id, 0)
+    ref_items = list(ref_counts.items())
+    for start in range(0, len(ref_items), FIRESTORE_BATCH_LIMIT):
+        batch = db.batch()
+        for content_hash, count in ref_items[start:start + FIRESTORE_BATCH_LIMIT]:
+            if count:
+                batch.set(blob_ref_doc(content_hash), {
+                    'ref_count': count,
+                    'storage_path': content_blob_name(content_hash)
+                })
+            else:
+                batch.delete(blob_ref_doc(content_hash))
+        with metrics.timed('firestore', 'batch_commit'):
+            batch.commit()
+
+    # 總數寫入第 0 個分片，其餘分片歸零
+    batch = db.batch()
+    shards_ref = stats_shards_ref()
+    for shard_id in range(app.config['COUNTER_SHARDS']):
+        values = {'count': 0, 'total_size': 0}
+        if shard_id == 0:
+            values = {'count': total_submissions, 'total_size': total_size}
+        # 版本只能遞增，避免與重建前的 ETag 相同
+        values['version'] = firestore.Increment(1)
+        batch.set(shards_ref.document(str(shard_id)), values, merge=True)
+    with metrics.timed('firestore', 'batch_commit'):
+        batch.commit()
+
+    # 每日統計：每天只寫入一份 (覆寫分片 0)，刪除其餘舊的分片文件
+    with metrics.timed('firestore', 'list_documents'):
+        daily_docs = list(daily_stats_ref().list_documents())
+    daily_writes = [
+        ('delete', ref_doc, None) for ref_doc in daily_docs
+        if ref_doc.id.rsplit('-', 1)[0] not in days or not ref_doc.id.endswith('-0')
+    ]
+    daily_writes += [('set', daily_stats_ref().document(f"{day}-0"), {
+        'date': day,
+        'count': sum(bucket['count'] for bucket in hours.values()),
+        'total_size': sum(bucket['total_size'] for bucket in hours.values()),
+        'hours': hours
+    }) for day, hours in days.items()]
+    for start in range(0, len(daily_writes), FIRESTORE_BATCH_LIMIT):
+        batch = db.batch()
+        for action, ref_doc, values in daily_writes[start:start + FIRESTORE_BATCH_LIMIT]:
+            if action == 'delete':
+                batch.delete(ref_doc)
+            else:
+                batch.set(ref_doc, values)
+        with metrics.timed('firestore', 'batch_commit'):
+            batch.commit()
+    stats_cache.invalidate()
+
+    print(f"✓ 統計計數器已重建：{total_submissions} 筆，共 {format_file_size(total_size)}，{len(days)} 天的每日統計")
+
+
+@app.cli.command('reindex-search')
+def reindex_search_command():
+    """為所有 submissions 重建搜尋索引 token (flask reindex-search)
+
+    用於替建立搜尋索引前上傳的舊資料補上 search_tokens。
+    """
+    if not db:
+        print("❌ 資料庫未連接")
+        return
+
+    updated = 0
+    query = db.collection('submissions').select(list(SEARCH_FIELDS)).order_by('__name__')
+    for docs in iter_query_pages(query, FIRESTORE_BATCH_LIMIT):
+        batch = db.batch()
+        for doc in docs:
+            batch.update(doc.reference, {'search_tokens': build_search_tokens(doc.to_dict())})
+        with metrics.timed('firestore', 'batch_commit'):
+            batch.commit()
+        updated += len(docs)
+
+    print(f"✓ 已重建 {updated} 筆搜尋索引")
+
+
+@app.cli.command('refresh-archive')
+def refresh_archive_command():
+    """立即更新下載全部 ZIP 快取 (flask refresh-archive)"""
+    if not db:
+        print("❌ 資料庫未連接")
+        return
+
+    for variant, cache in archive_caches.items():
+        if variant != 'original' and not cache.built:
+            continue
+        added, removed = cache.refresh()
+        print(f"✓ 下載全部快取 ({variant}) 已更新：新增 {added} 個檔案，移除 {removed} 個檔案")
+
+
+@app.cli.command('export-snapshot')
+@click.argument('output_dir')
+@click.option('--format', 'export_format', type=click.Choice(list(SNAPSHOT_FORMATS)), default='jsonl')
+@click.option('--state', 'state_path', default=None, help='watermark 狀態檔 (預設為 OUTPUT_DIR/watermark.json)')
+def export_snapshot_command(output_dir, export_format, state_path):
+    """將上次匯出後新增的記錄分批寫入 OUTPUT_DIR (flask export-snapshot)
+
+    每批寫成一個檔案後才更新狀態檔的 watermark，中途失敗時重新執行會從最後完成的批次繼續。
+    """
+    if not db:
+        print("❌ 資料庫未連接")
+        return
+
+    if export_format == 'parquet':
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            print("❌ 匯出 Parquet 需要安裝 pyarrow (pip install pyarrow)")
+            return
+
+    os.makedirs(output_dir, exist_ok=True)
+    state_path = state_path or os.path.join(output_dir, 'watermark.json')
+    try:
+        with open(state_path, encoding='utf-8') as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        state = {'watermark': None, 'batches': 0}
+
+    exported = 0
+    while True:
+        rows, next_watermark, has_more = fetch_snapshot_batch(state['watermark'])
+        if not rows:
+            break
+        state['batches'] += 1
+        batch_path = os.path.join(output_dir, f"submissions-{state['batches']:06d}.{export_format}")
+        with open(batch_path + '.tmp', 'wb') as f:
+            f.write(encode_snapshot_batch(rows, export_format))
+        os.replace(batch_path + '.tmp', batch_path)
+
+        state['watermark'] = next_watermark
+        with open(state_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(state_path + '.tmp', state_path)
+        exported += len(rows)
+        if not has_more:
+            break
+
+    print(f"✓ 已匯出 {exported} 筆新記錄，watermark: {state['watermark']}")
+
+
+@app.cli.command('generate-thumbnails')
+def generate_thumbnails_command():
+    """替尚未產生縮圖的圖片記錄補上縮圖與網頁版 (flask generate-thumbnails)"""
+    if not db:
+        print("❌ 資料庫未連接")
+        return
+
+    futures = []
+    query = db.collection('submissions').select(
+        ['original_filename', 'storage_path', 'content_hash', 'thumbnail_path']
+    ).order_by('__name__')
+    for docs in iter_query_pages(query, FIRESTORE_BATCH_LIMIT):
+        for doc in docs:
+            data = doc.to_dict()
+            if data.get('thumbnail_path') or not data.get('storage_path'):
+                continue
+            if is_image_file(data.get('original_filename', '')):
+                futures.append(image_executor.submit(create_image_derivatives, doc.reference, data))
+
+    created = sum(1 for future in futures if future.result())
+    print(f"✓ 已產生 {created} 筆圖片縮圖，{len(futures) - created} 筆失敗")
+
+
 # ============== 錯誤處理 ==============
 
 @app.errorhandler(404)
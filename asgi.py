@@ -0,0 +1,253 @@
+"""親子資訊素養工作坊 - 非同步上傳入口 (ASGI)
+
+以 uvicorn 啟動時，/async/submit 由事件迴圈直接處理：
+讀取請求內容不佔用執行緒，慢速的手機上傳不會卡住 worker；
+寫入 Storage / Firestore 等阻塞呼叫則交給執行緒池，並重複使用一組 Storage 用戶端。
+其他路徑轉交原本的 Flask 應用程式處理。
+
+啟動方式：
+    uvicorn asgi:application --host 0.0.0.0 --port 5002
+
+上傳方式 (請求內容即為檔案本身，不使用 multipart)：
+    POST /async/submit?child_name=...&parent_info=...&filename=...
+    Content-Type: 檔案的 MIME type
+"""
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+from asgiref.wsgi import WsgiToAsgi
+from werkzeug.datastructures import FileStorage
+
+import app as upload_app
+import metrics
+
+flask_app = upload_app.app
+
+# 請求內容超過此大小時改寫入暫存檔，避免大量同時上傳佔滿記憶體
+SPOOL_MAX_MEMORY = 1024 * 1024
+
+
+def new_storage_bucket():
+    """建立一個擁有獨立連線池的 Storage bucket 物件"""
+    import firebase_admin
+    from google.cloud import storage as gcs
+
+    firebase_app = firebase_admin.get_app()
+    client = gcs.Client(
+        project=firebase_app.project_id,
+        credentials=firebase_app.credential.get_credential()
+    )
+    return client.bucket(firebase_app.options.get('storageBucket'))
+
+
+class StorageClientPool:
+    """重複使用的 Storage 用戶端池
+
+    每個用戶端各自持有 HTTP 連線池，同一時間只借給一個上傳使用；
+    用戶端在第一次需要時才建立，最多 size 個。
+    """
+
+    def __init__(self, size, factory=new_storage_bucket):
+        self.size = size
+        self.factory = factory
+        self._idle = asyncio.Queue()
+        self._created = 0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, loop, executor):
+        async with self._lock:
+            if self._idle.empty() and self._created < self.size:
+                self._created += 1
+                try:
+                    return await loop.run_in_executor(executor, self.factory)
+                except Exception:
+                    self._created -= 1
+                    raise
+        return await self._idle.get()
+
+    def release(self, bucket):
+        self._idle.put_nowait(bucket)
+
+
+class AsyncUploadApp:
+    """處理 /async/submit 的 ASGI 應用程式，其餘請求轉交 Flask"""
+
+    def __init__(self, wsgi_app, pool_size, workers):
+        self.wsgi = WsgiToAsgi(wsgi_app)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='async-upload')
+        self.pool = StorageClientPool(pool_size)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http' and scope['path'] == '/async/submit':
+            if scope['method'] != 'POST':
+                await self.respond(send, 405, {'error': 'Method Not Allowed'})
+                return
+            await self.handle_submit(scope, receive, self.timed_send(send, time.perf_counter()))
+            return
+        await self.wsgi(scope, receive, send)
+
+    def timed_send(self, send, started):
+        """送出回應標頭時記錄請求處理時間"""
+        async def wrapper(message):
+            if message['type'] == 'http.response.start':
+                metrics.REQUEST_SECONDS.labels('POST', '/async/submit', message['status']).observe(
+                    time.perf_counter() - started
+                )
+            await send(message)
+        return wrapper
+
+    async def respond(self, send, status, payload, retry_after=None):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        headers = [
+            (b'content-type', b'application/json; charset=utf-8'),
+            (b'content-length', str(len(body)).encode('ascii')),
+        ]
+        if retry_after is not None:
+            headers.append((b'retry-after', str(max(1, int(retry_after + 0.999))).encode('ascii')))
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def read_body(self, receive, spool, max_size):
+        """逐段讀取請求內容寫入暫存檔，超過 max_size 時回傳 None"""
+        size = 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return None
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if size > max_size:
+                return None
+            spool.write(chunk)
+            if not message.get('more_body'):
+                return size
+
+    async def handle_submit(self, scope, receive, send):
+        """與 /submit 共用流量控制 (app.admission_control)：讀取請求內容前先檢查頻率與處理中的請求數"""
+        headers = {key.decode('latin-1').lower(): value.decode('latin-1') for key, value in scope['headers']}
+        client = scope.get('client')
+        ip_address = client[0] if client else None
+
+        rate_limiter = upload_app.submit_rate_limiter
+        wait = rate_limiter.consume(ip_address) if rate_limiter else 0
+        if wait:
+            metrics.UPLOAD_ADMISSIONS.labels('rate_limited').inc()
+            await self.respond(send, 429, {'error': '上傳太頻繁，請稍後再試'}, retry_after=wait)
+            return
+
+        try:
+            size = max(0, min(int(headers.get('content-length', 0)), flask_app.config['MAX_CONTENT_LENGTH']))
+        except ValueError:
+            size = 0
+        admission = upload_app.submit_admission
+        started = time.perf_counter()
+        # 排隊等待會阻塞，交給預設執行緒池，不佔用處理上傳的執行緒
+        admitted = await asyncio.get_running_loop().run_in_executor(None, admission.acquire, size)
+        metrics.UPLOAD_ADMISSION_WAIT_SECONDS.observe(time.perf_counter() - started)
+        if not admitted:
+            metrics.UPLOAD_ADMISSIONS.labels('overloaded').inc()
+            retry_after = flask_app.config['SUBMIT_RETRY_AFTER']
+            await self.respond(send, 503, {'error': '目前上傳人數眾多，請稍候幾秒後再試一次'},
+                               retry_after=retry_after + random.uniform(0, retry_after))
+            return
+
+        metrics.UPLOAD_ADMISSIONS.labels('admitted').inc()
+        try:
+            await self.process_submit(scope, receive, send, headers, ip_address)
+        finally:
+            admission.release(size)
+
+    async def process_submit(self, scope, receive, send, headers, ip_address):
+        if not upload_app.db:
+            await self.respond(send, 500, {'error': '系統錯誤：資料庫未連接'})
+            return
+
+        params = {key: values[0] for key, values in parse_qs(scope['query_string'].decode('utf-8')).items()}
+        child_name = params.get('child_name', '').strip()
+        parent_info = params.get('parent_info', '').strip()
+        original_filename = os.path.basename(params.get('filename', '').strip())
+        max_size = flask_app.config['MAX_CONTENT_LENGTH']
+
+        if not child_name:
+            await self.respond(send, 400, {'error': '請填寫孩子姓名'})
+            return
+        if not original_filename or not upload_app.allowed_file(original_filename):
+            metrics.UPLOAD_FILES.labels('rejected').inc()
+            await self.respond(send, 400, {'error': '不支援的檔案格式'})
+            return
+        try:
+            if int(headers.get('content-length', 0)) > max_size:
+                metrics.UPLOAD_FILES.labels('rejected').inc()
+                await self.respond(send, 413, {'error': '檔案過大'})
+                return
+        except ValueError:
+            await self.respond(send, 400, {'error': 'Content-Length 格式錯誤'})
+            return
+
+        with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY) as spool:
+            size = await self.read_body(receive, spool, max_size)
+            if not size:
+                metrics.UPLOAD_FILES.labels('rejected').inc()
+                await self.respond(send, 413 if size is None else 400, {'error': '檔案過大或內容為空'})
+                return
+            spool.seek(0)
+
+            file = FileStorage(
+                stream=spool,
+                filename=original_filename,
+                content_type=headers.get('content-type', 'application/octet-stream')
+            )
+
+            loop = asyncio.get_running_loop()
+            bucket = await self.pool.acquire(loop, self.executor)
+            # 寫入記錄失敗時仍要以同一個用戶端回復 blob 引用，處理完才歸還
+            try:
+                try:
+                    file_fields, created = await loop.run_in_executor(
+                        self.executor, upload_app.upload_to_storage, bucket, file
+                    )
+                except Exception as e:
+                    print(f"非同步上傳失敗: {e}")
+                    metrics.UPLOAD_FILES.labels('failed').inc()
+                    await self.respond(send, 502, {'error': '檔案上傳失敗，請重試'})
+                    return
+
+                record = {
+                    'child_name': child_name,
+                    'parent_info': parent_info,
+                    **file_fields,
+                    'upload_time': datetime.utcnow(),
+                    'ip_address': ip_address
+                }
+                try:
+                    await loop.run_in_executor(self.executor, upload_app.persist_submissions, [record])
+                except Exception as e:
+                    print(f"寫入 Firestore 失敗: {e}")
+                    metrics.UPLOAD_FILES.labels('failed').inc()
+                    await loop.run_in_executor(
+                        self.executor, upload_app.release_blob_refs, bucket, [file_fields['content_hash']]
+                    )
+                    await self.respond(send, 502, {'error': '寫入記錄失敗，請重試'})
+                    return
+            finally:
+                self.pool.release(bucket)
+
+        await self.respond(send, 201, {
+            'success': True,
+            'original_filename': original_filename,
+            'file_size': file_fields['file_size']
+        })
+
+
+application = AsyncUploadApp(
+    flask_app,
+    pool_size=flask_app.config['ASYNC_STORAGE_CLIENTS'],
+    workers=flask_app.config['ASYNC_UPLOAD_WORKERS']
+)
@@ -0,0 +1,106 @@
+"""親子資訊素養工作坊 - 靜態檔案
+
+掃描 static/ 下的檔案並以內容雜湊產生帶指紋的檔名 (css/style.1a2b3c4d5e6f.css)。
+網址隨內容改變，瀏覽器可長期快取而不必每次重新驗證。
+文字類檔案預先壓縮成 gzip (有安裝 brotli 時另產生 br)，送出時依 Accept-Encoding 選擇。
+所有內容保存在記憶體中，static/ 只有少量小檔案。
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import threading
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# 值得預先壓縮的檔案類型 (圖片本身已壓縮)
+COMPRESSIBLE_TYPES = {'text/css', 'text/javascript', 'application/javascript', 'application/json', 'image/svg+xml'}
+
+
+class Asset:
+    """單一靜態檔案：原始內容與各種壓縮版本"""
+
+    def __init__(self, path, digest, content_type, content):
+        self.path = path
+        self.digest = digest
+        self.content_type = content_type
+        self.variants = {'identity': content}
+
+    def compress(self):
+        content = self.variants['identity']
+        candidates = {'gzip': gzip.compress(content, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            candidates['br'] = brotli.compress(content, quality=11)
+        # 壓縮後沒有變小就不保留
+        self.variants.update(
+            (encoding, data) for encoding, data in candidates.items() if len(data) < len(content)
+        )
+
+
+def fingerprint_path(path, digest):
+    """css/style.css -> css/style.{digest}.css"""
+    root, ext = os.path.splitext(path)
+    return f"{root}.{digest}{ext}"
+
+
+def strip_fingerprint(path):
+    """fingerprint_path 的反向操作，回傳 (原始路徑, digest)；沒有指紋時 digest 為 None"""
+    root, ext = os.path.splitext(path)
+    base, dot, digest = root.rpartition('.')
+    if not dot or '/' in digest:
+        return path, None
+    return base + ext, digest
+
+
+class AssetManifest:
+    """static/ 的檔案清單，第一次使用時才掃描並壓縮"""
+
+    def __init__(self, directory, digest_size=12):
+        self.directory = directory
+        self.digest_size = digest_size
+        self._assets = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        """掃描並預先壓縮所有檔案，回傳 {原始路徑: Asset}"""
+        if self._assets is None:
+            with self._lock:
+                if self._assets is None:
+                    self._assets = self._scan()
+        return self._assets
+
+    def _scan(self):
+        assets = {}
+        for root, _, filenames in os.walk(self.directory):
+            for filename in filenames:
+                full_path = os.path.join(root, filename)
+                path = os.path.relpath(full_path, self.directory).replace(os.sep, '/')
+                with open(full_path, 'rb') as f:
+                    content = f.read()
+                digest = hashlib.sha256(content).hexdigest()[:self.digest_size]
+                content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+                asset = Asset(path, digest, content_type, content)
+                if content_type in COMPRESSIBLE_TYPES or content_type.startswith('text/'):
+                    asset.compress()
+                assets[path] = asset
+        return assets
+
+    def get(self, path):
+        return self.load().get(path)
+
+    def url_path(self, path):
+        """帶指紋的相對路徑；找不到檔案時回傳 None"""
+        asset = self.get(path)
+        return fingerprint_path(path, asset.digest) if asset else None
+
+    def resolve(self, requested):
+        """由請求路徑找出檔案，回傳 (Asset, 指紋是否符合目前內容)"""
+        path, digest = strip_fingerprint(requested)
+        asset = self.get(path)
+        if asset is None:
+            # 檔名本身含有 "." 且沒有指紋 (例如 jquery.min.js)
+            return self.get(requested), False
+        return asset, digest == asset.digest
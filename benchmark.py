@@ -0,0 +1,357 @@
+"""親子資訊素養工作坊 - 離線效能測試
+
+以 fake_firebase 的記憶體 Firestore / Storage 取代 app.py 的 db 與 storage.bucket()，
+不需連線正式環境即可量測 /submit、/admin/dashboard、/admin/export、/admin/download-all
+的延遲 (p50 / p95 / p99)、吞吐量與記憶體用量。
+
+使用方式：
+    python benchmark.py                                        # 100 與 1000 筆資料
+    python benchmark.py --sizes 100,10000,100000 --firestore-latency 20 --storage-latency 40
+    python benchmark.py --save-baseline bench_baseline.json    # 儲存結果作為基準
+    python benchmark.py --baseline bench_baseline.json         # 與基準比較，有退步時結束碼為 1
+"""
+import argparse
+import gc
+import hashlib
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from werkzeug.security import generate_password_hash
+
+# 先匯入 app 再匯入替身 (替身會載入 google-cloud 套件)，以量到 app 本身的匯入時間
+_import_started = time.perf_counter()
+import app as upload_app
+APP_IMPORT_SECONDS = time.perf_counter() - _import_started
+
+from fake_firebase import FakeFirestore, FakeBucket
+
+ADMIN_USERNAME = 'admin'
+ADMIN_PASSWORD = 'benchmark'
+
+CHILD_NAMES = ['王小明', '陳美玲', '林大文', '張家豪', '李欣怡', 'Alice Chen', 'Bob Lin', '黃志明']
+FILE_EXTENSIONS = ['pdf', 'docx', 'pptx', 'txt', 'jpg', 'png']
+SEARCH_TERM = '小明'
+
+
+# ============== 記憶體量測 ==============
+
+def current_rss():
+    """目前行程的 RSS (bytes)；沒有 /proc 的系統改用 ru_maxrss (歷史最高值)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 以 KB 為單位，macOS 以 bytes 為單位
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class RssSampler:
+    """在背景定期取樣 RSS，記錄量測期間的最高值"""
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, current_rss())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = current_rss()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss())
+
+
+# ============== 測試資料 ==============
+
+def install_fakes(firestore_latency, storage_latency, cache_dir):
+    """把 app.py 的 db 與 storage.bucket() 換成記憶體替身"""
+    client = FakeFirestore(latency=firestore_latency)
+    bucket = FakeBucket(latency=storage_latency)
+    upload_app.db = client
+    upload_app.storage = SimpleNamespace(bucket=lambda name=None: bucket)
+    upload_app.AdminUser.invalidate()
+    # 快取只在量測時手動建立，避免背景更新干擾其他路由的數據
+    upload_app.archive_caches = {
+        variant: upload_app.ArchiveCache(os.path.join(cache_dir, variant), 24 * 60 * 60, variant)
+        for variant in upload_app.ARCHIVE_VARIANTS
+    }
+    # 測試資料不是真的圖片，不產生縮圖
+    upload_app.app.config['IMAGE_DERIVATIVES'] = False
+    # 所有測試請求來自同一個 IP，不套用單一 IP 的頻率限制 (同時處理數上限仍有效)
+    upload_app.submit_rate_limiter = upload_app.RateLimiter(rate=1e9, burst=1e9)
+    return client, bucket
+
+
+def seed_dataset(client, bucket, size, file_size):
+    """以 app.py 自己的寫入函式建立 size 筆提交記錄與對應的 Storage 檔案"""
+    firestore_latency, storage_latency = client.latency, bucket.latency
+    client.latency = bucket.latency = 0
+    try:
+        client.collection('admins').document('benchmark').set({
+            'username': ADMIN_USERNAME,
+            'password_hash': generate_password_hash(ADMIN_PASSWORD)
+        })
+
+        start_time = datetime.now(timezone.utc) - timedelta(seconds=size)
+        records = []
+        for i in range(size):
+            ext = FILE_EXTENSIONS[i % len(FILE_EXTENSIONS)]
+            original_filename = f"作業{i}.{ext}"
+            # 每個檔案內容不同，避免被內容去重合併
+            content = i.to_bytes(8, 'big') * (file_size // 8 + 1)
+            content = content[:file_size]
+            content_hash = hashlib.sha256(content).hexdigest()
+            blob = bucket.blob(upload_app.content_blob_name(content_hash))
+            upload_app.set_download_metadata(blob, original_filename)
+            blob.upload_from_string(content, content_type='application/octet-stream')
+            upload_app.add_blob_ref(content_hash)
+            records.append({
+                'child_name': CHILD_NAMES[i % len(CHILD_NAMES)],
+                'parent_info': f"09{i:08d}",
+                'file_url': blob.public_url,
+                'storage_path': blob.name,
+                'content_hash': content_hash,
+                'original_filename': original_filename,
+                'file_size': file_size,
+                'upload_time': start_time + timedelta(seconds=i),
+                'ip_address': '127.0.0.1'
+            })
+        upload_app.save_submissions(records)
+    finally:
+        client.latency, bucket.latency = firestore_latency, storage_latency
+
+
+# ============== 量測 ==============
+
+def percentile(values, pct):
+    """最近排名法的百分位數"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def login(test_client):
+    response = test_client.post('/admin/login', data={'username': ADMIN_USERNAME, 'password': ADMIN_PASSWORD})
+    if response.status_code != 302:
+        raise RuntimeError(f"登入失敗 (HTTP {response.status_code})")
+    return test_client
+
+
+def consume(response):
+    """逐段讀完回應內容 (不整份留在記憶體)，回傳位元組數"""
+    size = 0
+    try:
+        for chunk in response.response:
+            size += len(chunk)
+    finally:
+        response.close()
+    return size
+
+
+def run_scenario(send, requests, concurrency, client, bucket, warmup=1):
+    """先送出 warmup 個不計入的請求，再以 concurrency 個執行緒送出 requests 個請求，回傳統計結果"""
+    local = threading.local()
+
+    def one(i):
+        if not hasattr(local, 'client'):
+            local.client = login(upload_app.app.test_client())
+        started = time.perf_counter()
+        response = send(local.client, i)
+        size = consume(response)
+        return time.perf_counter() - started, response.status_code, size
+
+    for i in range(warmup):
+        consume(send(login(upload_app.app.test_client()), -1 - i))
+
+    gc.collect()
+    reads, writes, operations = client.reads, client.writes, bucket.operations
+    with RssSampler() as rss:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(one, range(requests)))
+        elapsed = time.perf_counter() - started
+
+    latencies = [latency * 1000 for latency, _, _ in results]
+    return {
+        'requests': requests,
+        'errors': sum(1 for _, status, _ in results if status >= 400),
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+        'throughput_rps': round(requests / elapsed, 2) if elapsed else 0.0,
+        'bytes_per_request': sum(size for _, _, size in results) // requests,
+        'peak_rss_mb': round(rss.peak / 1024 / 1024, 1),
+        'firestore_reads_per_request': round((client.reads - reads) / requests, 1),
+        'firestore_writes_per_request': round((client.writes - writes) / requests, 1),
+        'storage_ops_per_request': round((bucket.operations - operations) / requests, 1),
+    }
+
+
+def submit_request(files_per_submit, file_size):
+    def send(test_client, i):
+        files = [(io.BytesIO(os.urandom(file_size)), f"bench_{i}_{n}.pdf") for n in range(files_per_submit)]
+        return test_client.post('/submit', data={
+            'child_name': CHILD_NAMES[i % len(CHILD_NAMES)],
+            'parent_info': 'benchmark',
+            'file': files
+        }, content_type='multipart/form-data')
+    return send
+
+
+def get_request(url):
+    return lambda test_client, i: test_client.get(url)
+
+
+def benchmark_size(size, args):
+    """建立 size 筆資料並依序量測各情境"""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        client, bucket = install_fakes(args.firestore_latency / 1000, args.storage_latency / 1000, cache_dir)
+        seed_started = time.perf_counter()
+        seed_dataset(client, bucket, size, args.file_size)
+        print(f"\n== {size} 筆資料 (建立耗時 {time.perf_counter() - seed_started:.1f} 秒) ==")
+
+        heavy_requests = max(1, min(args.requests, args.heavy_requests))
+        scenarios = [
+            ('dashboard', get_request('/admin/dashboard'), args.requests),
+            ('dashboard_search', get_request(f'/admin/dashboard?search={SEARCH_TERM}'), args.requests),
+            ('export', get_request('/admin/export'), heavy_requests),
+            ('download_all', get_request('/admin/download-all'), heavy_requests),
+            ('download_all_cached', get_request('/admin/download-all'), heavy_requests),
+            # 上傳會新增資料，放在最後量測
+            ('submit', submit_request(args.files_per_submit, args.file_size), args.requests),
+        ]
+
+        results = {}
+        for name, send, requests in scenarios:
+            if args.only and name not in args.only:
+                continue
+            if name == 'download_all_cached':
+                upload_app.archive_caches['original'].refresh()
+            results[name] = run_scenario(send, requests, args.concurrency, client, bucket, args.warmup)
+            print_result(name, results[name])
+        return results
+
+
+# ============== 報表與基準比較 ==============
+
+def print_result(name, result):
+    print(
+        f"{name:<20} p50 {result['p50_ms']:>9.2f} ms  p95 {result['p95_ms']:>9.2f} ms  "
+        f"p99 {result['p99_ms']:>9.2f} ms  {result['throughput_rps']:>8.2f} req/s  "
+        f"RSS {result['peak_rss_mb']:>7.1f} MB  reads/req {result['firestore_reads_per_request']:>8.1f}"
+        + (f"  錯誤 {result['errors']}" if result['errors'] else '')
+    )
+
+
+def compare_with_baseline(results, baseline, threshold):
+    """p95 延遲、吞吐量或 RSS 比基準差超過 threshold 時列為退步，回傳退步項目"""
+    regressions = []
+    for size, scenarios in results.items():
+        for name, result in scenarios.items():
+            base = baseline.get('results', {}).get(size, {}).get(name)
+            if not base:
+                continue
+            checks = [
+                ('p95_ms', result['p95_ms'] > base['p95_ms'] * (1 + threshold) and result['p95_ms'] - base['p95_ms'] > 1),
+                ('throughput_rps', result['throughput_rps'] < base['throughput_rps'] * (1 - threshold)),
+                ('peak_rss_mb', result['peak_rss_mb'] > base['peak_rss_mb'] * (1 + threshold)),
+            ]
+            for metric, regressed in checks:
+                if regressed:
+                    regressions.append(f"{size} 筆 {name}: {metric} {base[metric]} → {result[metric]}")
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='以記憶體 Firestore / Storage 離線量測各路由效能')
+    parser.add_argument('--sizes', default='100,1000', help='資料筆數，以逗號分隔 (預設 100,1000)')
+    parser.add_argument('--requests', type=int, default=50, help='每個情境的請求數 (預設 50)')
+    parser.add_argument('--heavy-requests', type=int, default=5, help='匯出與下載全部的請求數上限 (預設 5)')
+    parser.add_argument('--warmup', type=int, default=1, help='每個情境先送出不計入統計的請求數 (預設 1)')
+    parser.add_argument('--concurrency', type=int, default=1, help='同時送出的請求數 (預設 1)')
+    parser.add_argument('--firestore-latency', type=float, default=0, help='每次 Firestore 呼叫的延遲毫秒數')
+    parser.add_argument('--storage-latency', type=float, default=0, help='每次 Storage 操作的延遲毫秒數')
+    parser.add_argument('--file-size', type=int, default=1024, help='每個檔案的位元組數 (預設 1024)')
+    parser.add_argument('--files-per-submit', type=int, default=3, help='每次上傳的檔案數 (預設 3)')
+    parser.add_argument('--only', help='只量測指定情境，以逗號分隔 (例如 dashboard,export)')
+    parser.add_argument('--output', help='將結果寫入 JSON 檔')
+    parser.add_argument('--save-baseline', help='將結果儲存為基準 JSON 檔')
+    parser.add_argument('--baseline', help='與基準 JSON 檔比較')
+    parser.add_argument('--threshold', type=float, default=0.2, help='視為退步的比例 (預設 0.2 = 20%%)')
+    args = parser.parse_args(argv)
+    args.sizes = [int(size) for size in args.sizes.split(',')]
+    args.only = set(args.only.split(',')) if args.only else None
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not upload_app.app.config.get('SECRET_KEY'):
+        upload_app.app.config['SECRET_KEY'] = 'benchmark'
+
+    report = {
+        'meta': {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'app_import_ms': round(APP_IMPORT_SECONDS * 1000, 1),
+            'platform': platform.platform(),
+            'firestore_latency_ms': args.firestore_latency,
+            'storage_latency_ms': args.storage_latency,
+            'file_size': args.file_size,
+            'files_per_submit': args.files_per_submit,
+            'concurrency': args.concurrency,
+        },
+        'results': {str(size): benchmark_size(size, args) for size in args.sizes}
+    }
+    print(f"\napp.py 匯入耗時 {report['meta']['app_import_ms']} ms")
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            print(f"\n✓ 已寫入 {path}")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get('meta', {}).get('firestore_latency_ms') != args.firestore_latency or \
+                baseline.get('meta', {}).get('storage_latency_ms') != args.storage_latency:
+            print("⚠️ 基準的延遲設定與本次不同，比較結果僅供參考")
+        regressions = compare_with_baseline(report['results'], baseline, args.threshold)
+        if regressions:
+            print(f"\n❌ 與基準相比有 {len(regressions)} 項退步：")
+            for line in regressions:
+                print(f"  - {line}")
+            return 1
+        print("\n✓ 與基準相比沒有退步")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -19,6 +19,97 @@ class Config:
         'png', 'zip', 'rar'
     }
     
+    # 分段續傳上傳設定 (每個分段仍受 MAX_CONTENT_LENGTH 限制)
+    UPLOAD_CHUNK_SIZE = 5 * 1024 * 1024  # 5MB
+    CHUNKED_UPLOAD_MAX_SIZE = 500 * 1024 * 1024  # 500MB
+    
+    # 直傳 Storage (Signed URL) 設定
+    DIRECT_UPLOAD_MAX_SIZE = 500 * 1024 * 1024  # 500MB
+    SIGNED_URL_EXPIRATION = 15 * 60  # 上傳網址有效秒數
+    
+    # 同時上傳到 Storage 的檔案數上限 (每個 worker 共用)
+    UPLOAD_CONCURRENCY = int(os.environ.get('UPLOAD_CONCURRENCY', 4))
+    # 刪除 Storage 檔案的並行數 (獨立的執行緒池，批次刪除不會佔用家長上傳的執行緒)
+    DELETE_CONCURRENCY = int(os.environ.get('DELETE_CONCURRENCY', 4))
+    
+    # /submit 流量控制 (每個 worker 行程各自計算)
+    SUBMIT_MAX_INFLIGHT = int(os.environ.get('SUBMIT_MAX_INFLIGHT', 8))  # 同時處理的上傳請求數
+    SUBMIT_MAX_BUFFERED_BYTES = int(os.environ.get('SUBMIT_MAX_BUFFERED_BYTES', 64 * 1024 * 1024))  # 處理中請求的總大小
+    SUBMIT_MAX_QUEUE = int(os.environ.get('SUBMIT_MAX_QUEUE', 32))  # 排隊等待的請求數上限
+    SUBMIT_QUEUE_TIMEOUT = float(os.environ.get('SUBMIT_QUEUE_TIMEOUT', 5))  # 排隊最多等待秒數
+    SUBMIT_RETRY_AFTER = 5  # 忙碌時建議用戶端重試的秒數
+    # 每個 IP 的上傳頻率 (token bucket)，預設關閉 (0)：
+    # 工作坊現場整間教室經由同一個 Wi-Fi NAT 對外，同一時間全班上傳會被視為同一個 IP；
+    # 需要時請設定為遠高於全班人數的值
+    SUBMIT_RATE_PER_MINUTE = float(os.environ.get('SUBMIT_RATE_PER_MINUTE', 0))
+    SUBMIT_RATE_BURST = int(os.environ.get('SUBMIT_RATE_BURST', 100))
+    
+    # 應用程式前方可信任的反向代理層數 (Zeabur 等平台為 1)，用於由 X-Forwarded-For 取得用戶端 IP；
+    # 直接對外服務時必須為 0，否則用戶端可以偽造 IP
+    TRUSTED_PROXY_HOPS = int(os.environ.get('TRUSTED_PROXY_HOPS', 0))
+    
+    # 非同步上傳入口 (asgi.py) 設定
+    ASYNC_STORAGE_CLIENTS = int(os.environ.get('ASYNC_STORAGE_CLIENTS', 8))  # 重複使用的 Storage 用戶端數
+    ASYNC_UPLOAD_WORKERS = int(os.environ.get('ASYNC_UPLOAD_WORKERS', 32))  # 執行阻塞呼叫的執行緒數
+    
+    # 下載全部 (ZIP) 設定
+    ZIP_PREFETCH = int(os.environ.get('ZIP_PREFETCH', 4))  # 預先開啟的檔案數 (每個只先讀取第一段)
+    ZIP_CHUNK_SIZE = int(os.environ.get('ZIP_CHUNK_SIZE', 1024 * 1024))  # 每次從 Storage 讀取並寫入 ZIP 的大小
+    ZIP_STORED_EXTENSIONS = {  # 已壓縮過的格式，直接儲存不再壓縮
+        'jpg', 'jpeg', 'png', 'zip', 'rar', 'docx', 'pptx'
+    }
+    # 下載全部 ZIP 快取 (記錄新增或刪除後於背景更新)
+    ARCHIVE_CACHE_DIR = os.environ.get('ARCHIVE_CACHE_DIR') or os.path.join(UPLOAD_FOLDER, 'archive')
+    ARCHIVE_REFRESH_DELAY = int(os.environ.get('ARCHIVE_REFRESH_DELAY', 30))  # 合併連續觸發的等待秒數
+    
+    # 圖片縮圖與網頁版 (上傳後於背景產生，需要 Pillow)
+    IMAGE_DERIVATIVES = os.environ.get('IMAGE_DERIVATIVES', '1') == '1'
+    IMAGE_EXTENSIONS = {'jpg', 'jpeg', 'png'}
+    IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', 2))
+    THUMBNAIL_SIZE = 320  # 管理後台縮圖的長邊像素
+    WEB_RENDITION_MAX_SIDE = int(os.environ.get('WEB_RENDITION_MAX_SIDE', 1600))  # 壓縮版下載的長邊上限
+    WEB_RENDITION_QUALITY = int(os.environ.get('WEB_RENDITION_QUALITY', 80))
+    
+    # 管理員檔案代理 (/admin/file) 的本機磁碟快取
+    FILE_CACHE_DIR = os.environ.get('FILE_CACHE_DIR') or os.path.join(UPLOAD_FOLDER, 'file_cache')
+    FILE_CACHE_MAX_BYTES = int(os.environ.get('FILE_CACHE_MAX_BYTES', 1024 * 1024 * 1024))
+    # 超過此大小的檔案不放入快取，改以簽名網址直接從 Storage 下載
+    FILE_CACHE_MAX_FILE_BYTES = int(os.environ.get('FILE_CACHE_MAX_FILE_BYTES', 128 * 1024 * 1024))
+    
+    # Firebase 初始化 (或初始化後確認預設管理員) 失敗時，每隔幾秒於下次使用時重試
+    FIREBASE_INIT_RETRY_INTERVAL = int(os.environ.get('FIREBASE_INIT_RETRY_INTERVAL', 30))
+    
     # 分頁設定
     ITEMS_PER_PAGE = 20
+    
+    # CSV 匯出時每次向 Firestore 讀取的筆數
+    EXPORT_PAGE_SIZE = 500
+    
+    # 增量匯出 (/admin/export/snapshot、flask export-snapshot) 每批筆數
+    EXPORT_SNAPSHOT_BATCH_SIZE = int(os.environ.get('EXPORT_SNAPSHOT_BATCH_SIZE', 1000))
+    # 只匯出上傳超過此秒數的記錄，避免 write-behind 日誌尚未寫入的較早記錄被 watermark 跳過
+    EXPORT_SNAPSHOT_LAG = int(os.environ.get('EXPORT_SNAPSHOT_LAG', 300))
+    
+    # 管理員資料快取 (減少每個請求的 Firestore 讀取)
+    ADMIN_CACHE_TTL = 300  # 秒
+    ADMIN_CACHE_SIZE = 128
+    
+    # submissions 記錄 write-behind 日誌：先寫入本機日誌檔即回應，再於背景批次寫入 Firestore
+    SUBMISSION_JOURNAL = os.environ.get('SUBMISSION_JOURNAL', '0') == '1'
+    SUBMISSION_JOURNAL_DIR = os.environ.get('SUBMISSION_JOURNAL_DIR') or os.path.join(UPLOAD_FOLDER, 'journal')
+    SUBMISSION_JOURNAL_INTERVAL = float(os.environ.get('SUBMISSION_JOURNAL_INTERVAL', 0.5))  # 累積記錄的秒數
+    
+    # 統計計數器 (總數、總大小、版本) 快取秒數；本行程的寫入會立即更新，其他 worker 的寫入最多延遲此秒數
+    STATS_CACHE_TTL = float(os.environ.get('STATS_CACHE_TTL', 2))
+    
+    # /metrics 驗證用 token (未設定時需登入管理員才能查看)
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    
+    # 統計計數器分片數 (分散同時上傳時對同一份文件的寫入)
+    COUNTER_SHARDS = 10
+    
+    # 每日 / 每小時統計與日期篩選使用的時區 (只給日期的 since / until 以此時區的整天計算)
+    STATS_TIMEZONE = os.environ.get('STATS_TIMEZONE', 'Asia/Taipei')
+    STATS_HISTOGRAM_DAYS = 14  # 管理後台未篩選時顯示最近幾天
+    STATS_HISTOGRAM_MAX_DAYS = 92  # 篩選範圍超過此天數時只顯示最後這幾天
 
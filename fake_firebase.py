@@ -0,0 +1,716 @@
+"""親子資訊素養工作坊 - 記憶體內的 Firestore / Storage 替身
+
+供 benchmark.py 離線量測與 tests/ 使用，只實作 app.py 用到的 API。
+每次 Firestore RPC 與 Storage 操作可設定固定延遲，模擬實際的網路往返時間。
+"""
+import copy
+import io
+import itertools
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from urllib.parse import quote
+
+from google.cloud.firestore_v1 import transforms
+
+
+class NotFound(Exception):
+    """文件或 Storage 物件不存在"""
+
+
+class PreconditionFailed(Exception):
+    """Storage 操作的 generation / metageneration 前提條件不符"""
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def _normalize(value):
+    """Firestore 回傳的時間一律帶時區"""
+    if isinstance(value, datetime) and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    if isinstance(value, dict):
+        return {key: _normalize(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_normalize(item) for item in value]
+    return value
+
+
+def _get_field(data, path):
+    for part in path.split('.'):
+        if not isinstance(data, dict) or part not in data:
+            return None
+        data = data[part]
+    return data
+
+
+def _merge_field(target, key, value):
+    """set(merge=True) 時巢狀 map 逐欄位合併 (與 Firestore 相同)"""
+    if not isinstance(target.get(key), dict):
+        target[key] = {}
+    for sub_key, sub_value in value.items():
+        if isinstance(sub_value, dict):
+            _merge_field(target[key], sub_key, sub_value)
+        else:
+            _apply_field(target[key], sub_key, sub_value)
+
+
+def _apply_field(target, path, value):
+    """寫入單一欄位並套用 Increment / ArrayUnion 等 transform"""
+    parts = path.split('.')
+    for part in parts[:-1]:
+        target = target.setdefault(part, {})
+    key = parts[-1]
+    if value is transforms.DELETE_FIELD:
+        target.pop(key, None)
+    elif value is transforms.SERVER_TIMESTAMP:
+        target[key] = _now()
+    elif isinstance(value, transforms.Increment):
+        target[key] = target.get(key, 0) + value.value
+    elif isinstance(value, transforms.ArrayUnion):
+        current = list(target.get(key, []))
+        current.extend(item for item in value.values if item not in current)
+        target[key] = current
+    elif isinstance(value, transforms.ArrayRemove):
+        target[key] = [item for item in target.get(key, []) if item not in value.values]
+    elif isinstance(value, dict):
+        sub = target.get(key)
+        if not isinstance(sub, dict):
+            sub = target[key] = {}
+        for sub_key, sub_value in value.items():
+            _apply_field(sub, sub_key, sub_value)
+    else:
+        target[key] = _normalize(value)
+
+
+# ============== Firestore ==============
+
+class FakeFirestore:
+    """取代 firestore.client() 的記憶體資料庫"""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.reads = 0
+        self.writes = 0
+        self._collections = {}
+        self._versions = {}
+        self._sorted_cache = {}
+        self._lock = threading.RLock()
+
+    def _sleep(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def collection(self, path):
+        return FakeCollection(self, path)
+
+    def document(self, path):
+        collection_path, doc_id = path.rsplit('/', 1)
+        return FakeDocumentRef(self, collection_path, doc_id)
+
+    def batch(self):
+        return FakeBatch(self)
+
+    def transaction(self, **kwargs):
+        return FakeTransaction(self)
+
+    def get_all(self, refs, field_paths=None, transaction=None):
+        self._sleep()
+        for ref in refs:
+            yield ref._snapshot()
+
+    def _docs(self, collection_path):
+        return self._collections.setdefault(collection_path, {})
+
+    def _write(self, ref, data, merge=False, update=False, create=False):
+        with self._lock:
+            docs = self._docs(ref._collection_path)
+            exists = ref.id in docs
+            if update and not exists:
+                raise NotFound(ref.path)
+            if create and exists:
+                raise ValueError(f"文件已存在: {ref.path}")
+            current = docs[ref.id] if exists and (merge or update) else {}
+            for key, value in data.items():
+                if merge and isinstance(value, dict):
+                    _merge_field(current, key, value)
+                else:
+                    _apply_field(current, key, value)
+            docs[ref.id] = current
+            self._versions[ref._collection_path] = self._versions.get(ref._collection_path, 0) + 1
+            self.writes += 1
+
+    def _delete(self, ref):
+        with self._lock:
+            self._docs(ref._collection_path).pop(ref.id, None)
+            self._versions[ref._collection_path] = self._versions.get(ref._collection_path, 0) + 1
+            self.writes += 1
+
+
+class FakeDocumentRef:
+    def __init__(self, client, collection_path, doc_id):
+        self._client = client
+        self._collection_path = collection_path
+        self.id = doc_id
+        self.path = f"{collection_path}/{doc_id}"
+
+    @property
+    def parent(self):
+        return FakeCollection(self._client, self._collection_path)
+
+    def collection(self, name):
+        return FakeCollection(self._client, f"{self.path}/{name}")
+
+    def _snapshot(self):
+        with self._client._lock:
+            self._client.reads += 1
+            data = self._client._docs(self._collection_path).get(self.id)
+            return FakeSnapshot(self, copy.deepcopy(data) if data is not None else None)
+
+    def get(self, field_paths=None, transaction=None):
+        self._client._sleep()
+        return self._snapshot()
+
+    def set(self, data, merge=False):
+        self._client._sleep()
+        self._client._write(self, data, merge=merge)
+
+    def create(self, data):
+        self._client._sleep()
+        self._client._write(self, data, create=True)
+
+    def update(self, data):
+        self._client._sleep()
+        self._client._write(self, data, update=True)
+
+    def delete(self):
+        self._client._sleep()
+        self._client._delete(self)
+
+    def __eq__(self, other):
+        return isinstance(other, FakeDocumentRef) and other.path == self.path
+
+    def __hash__(self):
+        return hash(self.path)
+
+
+class FakeSnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field_path):
+        return _get_field(self._data or {}, field_path)
+
+
+class FakeAggregationResult:
+    def __init__(self, alias, value):
+        self.alias = alias
+        self.value = value
+
+
+class FakeAggregationQuery:
+    def __init__(self, query):
+        self._query = query
+        self._aggregations = []
+
+    def count(self, alias=None):
+        self._aggregations.append(('count', None, alias or 'count'))
+        return self
+
+    def sum(self, field_path, alias=None):
+        self._aggregations.append(('sum', field_path, alias or 'sum'))
+        return self
+
+    def get(self, transaction=None):
+        matches = self._query._matches()
+        # Firestore 的聚合查詢每 1000 筆索引項目計為一次讀取
+        self._query._client.reads += max(1, len(matches) // 1000)
+        results = []
+        for kind, field_path, alias in self._aggregations:
+            if kind == 'count':
+                value = len(matches)
+            else:
+                value = sum(_get_field(data, field_path) or 0 for _, data in matches)
+            results.append(FakeAggregationResult(alias, value))
+        return [results]
+
+
+_OPERATORS = {
+    '==': lambda a, b: a == b,
+    '!=': lambda a, b: a != b,
+    '<': lambda a, b: a < b,
+    '<=': lambda a, b: a <= b,
+    '>': lambda a, b: a > b,
+    '>=': lambda a, b: a >= b,
+    'in': lambda a, b: a in b,
+    'array_contains': lambda a, b: isinstance(a, list) and b in a,
+    'array_contains_any': lambda a, b: isinstance(a, list) and any(item in a for item in b),
+}
+
+
+class FakeQuery:
+    """不可變的查詢物件，行為與 Firestore 相同：
+
+    - 排序欄位不存在的文件不會出現在結果中
+    - 未指定 __name__ 排序時，以最後一個排序方向補上文件 ID 排序
+    - cursor 可以是 snapshot、欄位 dict 或值的列表
+    """
+
+    def __init__(self, client, path, filters=(), orders=(), limit=None, limit_to_last=False,
+                 start=None, end=None, fields=None):
+        self._client = client
+        self._path = path
+        self._filters = filters
+        self._orders = orders
+        self._limit = limit
+        self._limit_to_last = limit_to_last
+        self._start = start
+        self._end = end
+        self._fields = fields
+
+    def _copy(self, **changes):
+        options = {
+            'filters': self._filters, 'orders': self._orders, 'limit': self._limit,
+            'limit_to_last': self._limit_to_last, 'start': self._start, 'end': self._end,
+            'fields': self._fields,
+        }
+        options.update(changes)
+        return FakeQuery(self._client, self._path, **options)
+
+    def where(self, field_path=None, op_string=None, value=None, filter=None):
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(filters=self._filters + ((field_path, op_string, _normalize(value)),))
+
+    def order_by(self, field_path, direction='ASCENDING'):
+        return self._copy(orders=self._orders + ((field_path, direction),))
+
+    def limit(self, count):
+        return self._copy(limit=count, limit_to_last=False)
+
+    def limit_to_last(self, count):
+        return self._copy(limit=count, limit_to_last=True)
+
+    def select(self, field_paths):
+        return self._copy(fields=list(field_paths))
+
+    def start_after(self, cursor):
+        return self._copy(start=(cursor, False))
+
+    def start_at(self, cursor):
+        return self._copy(start=(cursor, True))
+
+    def end_before(self, cursor):
+        return self._copy(end=(cursor, False))
+
+    def end_at(self, cursor):
+        return self._copy(end=(cursor, True))
+
+    def count(self, alias=None):
+        return FakeAggregationQuery(self).count(alias)
+
+    def sum(self, field_path, alias=None):
+        return FakeAggregationQuery(self).sum(field_path, alias)
+
+    def _full_orders(self):
+        orders = list(self._orders)
+        if not any(field_path == '__name__' for field_path, _ in orders):
+            orders.append(('__name__', orders[-1][1] if orders else 'ASCENDING'))
+        return orders
+
+    @staticmethod
+    def _value(doc_id, data, field_path):
+        return doc_id if field_path == '__name__' else _get_field(data, field_path)
+
+    def _cursor_values(self, cursor, orders):
+        if isinstance(cursor, FakeSnapshot):
+            return [self._value(cursor.id, cursor._data, field_path) for field_path, _ in orders]
+        if isinstance(cursor, dict):
+            values = []
+            for field_path, _ in orders:
+                if field_path == '__name__':
+                    value = cursor.get('__name__')
+                    if value is None:
+                        break
+                    if isinstance(value, FakeDocumentRef):
+                        value = value.id
+                    values.append(value.rsplit('/', 1)[-1])
+                elif field_path in cursor:
+                    values.append(_normalize(cursor[field_path]))
+                else:
+                    break
+            return values
+        return [_normalize(value) for value in (cursor if isinstance(cursor, (list, tuple)) else [cursor])]
+
+    @staticmethod
+    def _compare(left, right, orders):
+        for (_, direction), a, b in zip(orders, left, right):
+            if a != b:
+                result = -1 if a < b else 1
+                return result if direction == 'ASCENDING' else -result
+        return 0
+
+    def _sorted(self, orders):
+        """符合篩選條件並排好序的 (文件 ID, 資料)
+
+        集合沒有寫入前重複使用排序結果，與 Firestore 索引一樣不必每次查詢都掃描整個集合。
+        """
+        key = (self._path, repr(self._filters), tuple(orders))
+        with self._client._lock:
+            version = self._client._versions.get(self._path, 0)
+            cached = self._client._sorted_cache.get(key)
+            if cached and cached[0] == version:
+                return cached[1]
+            items = list(self._client._docs(self._path).items())
+
+        for field_path, op_string, value in self._filters:
+            operator = _OPERATORS[op_string]
+            items = [
+                (doc_id, data) for doc_id, data in items
+                if self._value(doc_id, data, field_path) is not None
+                and operator(self._value(doc_id, data, field_path), value)
+            ]
+        for field_path, _ in orders:
+            if field_path != '__name__':
+                items = [(doc_id, data) for doc_id, data in items if _get_field(data, field_path) is not None]
+
+        # 由最後一個排序欄位開始做穩定排序，即可支援不同方向的多欄位排序
+        for field_path, direction in reversed(orders):
+            items.sort(
+                key=lambda item, field_path=field_path: self._value(item[0], item[1], field_path),
+                reverse=direction != 'ASCENDING'
+            )
+
+        with self._client._lock:
+            if len(self._client._sorted_cache) >= 64:
+                self._client._sorted_cache.clear()
+            self._client._sorted_cache[key] = (version, items)
+        return items
+
+    def _bound(self, items, orders, cursor, inclusive, is_start):
+        """以二分搜尋找出 cursor 在排序結果中的位置"""
+        values = self._cursor_values(cursor, orders)
+        cursor_orders = orders[:len(values)]
+        # start_after / end_at 包含與 cursor 相同的項目在前段，start_at / end_before 則否
+        equal_before = not inclusive if is_start else inclusive
+        low, high = 0, len(items)
+        while low < high:
+            middle = (low + high) // 2
+            doc_id, data = items[middle]
+            result = self._compare(
+                [self._value(doc_id, data, field_path) for field_path, _ in cursor_orders],
+                values, cursor_orders
+            )
+            if result < 0 or (result == 0 and equal_before):
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _matches(self):
+        """回傳符合篩選、排序與 cursor 條件的 (文件 ID, 資料)，不含 limit"""
+        self._client._sleep()
+        orders = self._full_orders()
+        items = self._sorted(orders)
+        start, end = 0, len(items)
+        if self._start is not None:
+            start = self._bound(items, orders, *self._start, is_start=True)
+        if self._end is not None:
+            end = self._bound(items, orders, *self._end, is_start=False)
+        return items[start:end]
+
+    def _run(self):
+        items = self._matches()
+        if self._limit is not None:
+            items = items[-self._limit:] if self._limit_to_last else items[:self._limit]
+        snapshots = []
+        for doc_id, data in items:
+            if self._fields is not None:
+                data = {
+                    field_path: _get_field(data, field_path) for field_path in self._fields
+                    if _get_field(data, field_path) is not None
+                }
+            snapshots.append(FakeSnapshot(FakeDocumentRef(self._client, self._path, doc_id), copy.deepcopy(data)))
+        # 查詢沒有結果時仍計為一次讀取
+        self._client.reads += max(1, len(snapshots))
+        return snapshots
+
+    def stream(self, transaction=None):
+        return iter(self._run())
+
+    def get(self, transaction=None):
+        return self._run()
+
+
+class FakeCollection(FakeQuery):
+    def __init__(self, client, path):
+        super().__init__(client, path)
+        self.id = path.rsplit('/', 1)[-1]
+
+    def document(self, document_id=None):
+        return FakeDocumentRef(self._client, self._path, document_id or uuid.uuid4().hex[:20])
+
+    def add(self, data):
+        ref = self.document()
+        ref.set(data)
+        return _now(), ref
+
+    def list_documents(self):
+        with self._client._lock:
+            return [FakeDocumentRef(self._client, self._path, doc_id) for doc_id in self._client._docs(self._path)]
+
+
+class FakeBatch:
+    def __init__(self, client):
+        self._client = client
+        self._writes = []
+
+    def set(self, reference, document_data, merge=False):
+        self._writes.append(('set', reference, document_data, merge))
+
+    def create(self, reference, document_data):
+        self._writes.append(('create', reference, document_data, False))
+
+    def update(self, reference, field_updates):
+        self._writes.append(('update', reference, field_updates, False))
+
+    def delete(self, reference):
+        self._writes.append(('delete', reference, None, False))
+
+    def __len__(self):
+        return len(self._writes)
+
+    def commit(self):
+        if len(self._writes) > 500:
+            raise ValueError("單一 batch 最多 500 筆寫入")
+        self._client._sleep()
+        with self._client._lock:
+            # 與 Firestore 相同，任一筆 create 的文件已存在時整批都不寫入
+            for kind, reference, data, merge in self._writes:
+                if kind == 'create' and reference.id in self._client._docs(reference._collection_path):
+                    raise ValueError(f"文件已存在: {reference.path}")
+            for kind, reference, data, merge in self._writes:
+                if kind == 'delete':
+                    self._client._delete(reference)
+                else:
+                    self._client._write(reference, data, merge=merge, update=kind == 'update', create=kind == 'create')
+        writes, self._writes = self._writes, []
+        return [None] * len(writes)
+
+
+class FakeTransaction(FakeBatch):
+    """搭配 @firestore.transactional 使用的交易
+
+    交易期間持有資料庫鎖，同一時間只有一個交易執行，因此不會發生衝突重試。
+    """
+    _max_attempts = 5
+    _read_only = False
+
+    def __init__(self, client):
+        super().__init__(client)
+        self._id = None
+
+    def _clean_up(self):
+        self._writes = []
+        self._id = None
+
+    def _begin(self, retry_id=None):
+        self._client._lock.acquire()
+        self._id = b'fake-transaction'
+
+    def _commit(self):
+        try:
+            return FakeBatch.commit(self)
+        finally:
+            self._id = None
+            self._client._lock.release()
+
+    def _rollback(self):
+        if self._id is not None:
+            self._id = None
+            self._writes = []
+            self._client._lock.release()
+
+    def get(self, ref_or_query):
+        if isinstance(ref_or_query, FakeDocumentRef):
+            return iter([ref_or_query._snapshot()])
+        return ref_or_query.stream()
+
+
+# ============== Storage ==============
+
+class FakeBucket:
+    """取代 storage.bucket() 的記憶體 bucket"""
+
+    def __init__(self, name='fake-bucket', latency=0.0):
+        self.name = name
+        self.latency = latency
+        self.operations = 0
+        self._objects = {}
+        self._lock = threading.RLock()
+
+    def _sleep(self):
+        self.operations += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def blob(self, blob_name):
+        return FakeBlob(self, blob_name)
+
+    def get_blob(self, blob_name):
+        self._sleep()
+        if blob_name not in self._objects:
+            return None
+        blob = FakeBlob(self, blob_name)
+        blob._load()
+        return blob
+
+    def list_blobs(self, prefix=None):
+        self._sleep()
+        with self._lock:
+            names = sorted(name for name in self._objects if not prefix or name.startswith(prefix))
+        blobs = []
+        for name in names:
+            blob = FakeBlob(self, name)
+            blob._load()
+            blobs.append(blob)
+        return blobs
+
+
+class FakeBlob:
+    _generations = itertools.count(1)
+
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+        self.content_type = None
+        self.content_disposition = None
+        self.metadata = None
+        self.size = None
+        self.etag = None
+        self.updated = None
+        self.generation = None
+        self.metageneration = None
+
+    @property
+    def public_url(self):
+        return f"https://storage.googleapis.com/{self.bucket.name}/{quote(self.name)}"
+
+    def _load(self):
+        stored = self.bucket._objects[self.name]
+        self.size = len(stored['data'])
+        self.content_type = stored['content_type']
+        self.content_disposition = stored['content_disposition']
+        self.metadata = stored['metadata']
+        self.etag = stored['etag']
+        self.updated = stored['updated']
+        self.generation = stored['generation']
+        self.metageneration = stored['metageneration']
+
+    def _store(self, data, content_type=None):
+        generation = next(self._generations)
+        with self.bucket._lock:
+            self.bucket._objects[self.name] = {
+                'data': bytes(data),
+                'content_type': content_type or self.content_type or 'application/octet-stream',
+                'content_disposition': self.content_disposition,
+                'metadata': self.metadata,
+                'etag': f"fake-etag-{generation}",
+                'updated': _now(),
+                'generation': generation,
+                'metageneration': 1,
+            }
+        self._load()
+
+    def _data(self):
+        try:
+            return self.bucket._objects[self.name]['data']
+        except KeyError:
+            raise NotFound(self.name) from None
+
+    def exists(self):
+        self.bucket._sleep()
+        return self.name in self.bucket._objects
+
+    def reload(self):
+        self.bucket._sleep()
+        self._data()
+        self._load()
+
+    def patch(self):
+        self.bucket._sleep()
+        with self.bucket._lock:
+            stored = self.bucket._objects.get(self.name)
+            if stored is None:
+                raise NotFound(self.name)
+            # 與 Storage 相同：metadata 逐鍵合併，未設定的屬性不變
+            if self.metadata is not None:
+                stored['metadata'] = {**(stored['metadata'] or {}), **self.metadata}
+            if self.content_disposition is not None:
+                stored['content_disposition'] = self.content_disposition
+            stored['metageneration'] += 1
+        self._load()
+
+    def upload_from_file(self, file_obj, content_type=None, rewind=False, **kwargs):
+        self.bucket._sleep()
+        if rewind:
+            file_obj.seek(0)
+        self._store(file_obj.read(), content_type)
+
+    def upload_from_string(self, data, content_type=None, **kwargs):
+        self.bucket._sleep()
+        self._store(data.encode('utf-8') if isinstance(data, str) else data, content_type)
+
+    def upload_from_filename(self, filename, content_type=None, **kwargs):
+        with open(filename, 'rb') as f:
+            self.upload_from_file(f, content_type=content_type)
+
+    def download_as_bytes(self, start=None, end=None, **kwargs):
+        self.bucket._sleep()
+        data = self._data()
+        if start is not None or end is not None:
+            return data[start or 0:end + 1 if end is not None else None]
+        return data
+
+    def download_to_file(self, file_obj, **kwargs):
+        file_obj.write(self.download_as_bytes(**kwargs))
+
+    def download_to_filename(self, filename, **kwargs):
+        with open(filename, 'wb') as f:
+            self.download_to_file(f, **kwargs)
+
+    def open(self, mode='rb', **kwargs):
+        return io.BytesIO(self.download_as_bytes())
+
+    def make_public(self):
+        self.bucket._sleep()
+        self._data()
+
+    def delete(self, if_generation_match=None, if_metageneration_match=None, **kwargs):
+        self.bucket._sleep()
+        with self.bucket._lock:
+            stored = self.bucket._objects.get(self.name)
+            if stored is None:
+                raise NotFound(self.name)
+            if (if_generation_match is not None and stored['generation'] != if_generation_match) or \
+                    (if_metageneration_match is not None and stored['metageneration'] != if_metageneration_match):
+                raise PreconditionFailed(self.name)
+            del self.bucket._objects[self.name]
+
+    def compose(self, sources, **kwargs):
+        self.bucket._sleep()
+        self._store(b''.join(source._data() for source in sources), self.content_type)
+
+    def generate_signed_url(self, expiration=None, method='GET', version='v4', **kwargs):
+        return f"https://storage.googleapis.com/{self.bucket.name}/{quote(self.name)}?X-Goog-Signature=fake&method={method}"
@@ -0,0 +1,28 @@
+"""Gunicorn 設定 (在專案根目錄執行 gunicorn 時會自動讀取)
+
+    gunicorn app:app
+
+- preload_app：master 先載入 app 並預先匯入 Firebase SDK，fork 出的 worker 直接共用已載入的模組
+- FIREBASE_WARM_UP=1：每個 worker 啟動時就建立 Firebase 連線，第一個請求不必等待初始化；
+  未設定時於第一次使用 Firebase 時才初始化，worker 啟動最快
+"""
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5002')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+# 打包下載等長時間串流的請求不會佔住整個 worker
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+preload_app = True
+
+
+def when_ready(server):
+    # 在 master 中執行 (fork 之前)：只匯入模組，不建立連線
+    import app
+    app.preload_modules()
+
+
+def post_fork(server, worker):
+    # gRPC 連線不能跨 fork 共用，因此在各 worker 中各自建立
+    if os.environ.get('FIREBASE_WARM_UP', '').lower() in ('1', 'true', 'yes'):
+        import app
+        app.warm_up()
@@ -0,0 +1,219 @@
+"""親子資訊素養工作坊 - 效能指標
+
+輕量的 Counter / Gauge / Histogram 實作，以 Prometheus 文字格式輸出。
+每次記錄只需取得一個鎖並更新數值，可在正式環境常態開啟。
+指標保存在各個行程的記憶體中，多 worker 部署時每個 worker 各自計數。
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# 預設的延遲分桶 (秒)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+REGISTRY = []
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """指標基底類別：依標籤值建立子項目，沒有標籤時直接操作自己"""
+    type_name = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=(), function=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        # function 讓指標在輸出時才讀取其他物件上的數值 (例如快取命中次數)
+        self.function = function
+        self._children = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} 需要標籤 {self.labelnames}")
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _default(self):
+        return self.labels()
+
+    def samples(self):
+        """回傳 (名稱後綴, 標籤 list, 數值) 的列表"""
+        if self.function is not None:
+            return [('', [], self.function())]
+        samples = []
+        for values, child in sorted(self._children.items()):
+            for suffix, extra, value in child.samples():
+                samples.append((suffix, list(zip(self.labelnames, values)) + extra, value))
+        return samples
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        for suffix, labels, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_format_labels((), (), labels)} {_format_value(value)}")
+        return '\n'.join(lines)
+
+
+class _Value:
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+    def samples(self):
+        return [('', [], self.value)]
+
+
+class Counter(Metric):
+    type_name = 'counter'
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        self._default().inc(amount)
+
+
+class Gauge(Metric):
+    type_name = 'gauge'
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        self._default().inc(amount)
+
+    def dec(self, amount=1):
+        self._default().dec(amount)
+
+    def set(self, value):
+        self._default().set(value)
+
+
+class _HistogramValue:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def samples(self):
+        with self._lock:
+            counts, total = list(self.counts), self.sum
+        samples = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            samples.append(('_bucket', [('le', _format_value(float(bound)))], cumulative))
+        samples.append(('_sum', [], total))
+        samples.append(('_count', [], cumulative))
+        return samples
+
+
+class Histogram(Metric):
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self._default().observe(value)
+
+
+def render():
+    """以 Prometheus 文字格式輸出所有指標"""
+    return '\n'.join(metric.render() for metric in REGISTRY) + '\n'
+
+
+# ============== 應用程式指標 ==============
+
+REQUEST_SECONDS = Histogram(
+    'http_request_duration_seconds', 'HTTP 請求處理時間 (串流回應只計算到開始送出)',
+    ['method', 'route', 'status']
+)
+FIREBASE_CALL_SECONDS = Histogram(
+    'firebase_call_duration_seconds', 'Firestore / Storage 呼叫耗時',
+    ['service', 'operation']
+)
+FIREBASE_CALL_ERRORS = Counter(
+    'firebase_call_errors_total', 'Firestore / Storage 呼叫失敗次數',
+    ['service', 'operation']
+)
+UPLOAD_BYTES = Counter('upload_bytes_total', '成功上傳的檔案位元組數')
+UPLOAD_FILES = Counter('upload_files_total', '上傳檔案數 (accepted / rejected / failed)', ['result'])
+EXPORT_BYTES = Counter('export_bytes_total', '匯出與打包下載送出的位元組數', ['format', 'source'])
+EXPORTS = Counter('exports_total', '匯出與打包下載次數', ['format', 'source'])
+UPLOAD_ADMISSIONS = Counter(
+    'upload_admissions_total', '/submit 流量控制結果 (admitted / queued / rate_limited / overloaded)', ['result']
+)
+UPLOAD_ADMISSION_WAIT_SECONDS = Histogram('upload_admission_wait_seconds', '/submit 排隊等待時間')
+FILE_CACHE_REQUESTS = Counter('file_cache_requests_total', '/admin/file 讀取方式 (hit / miss / redirect)', ['result'])
+IMAGE_DERIVATIVES = Counter('image_derivatives_total', '圖片縮圖產生次數 (created / reused / failed)', ['result'])
+
+
+@contextmanager
+def timed(service, operation):
+    """記錄一次 Firestore / Storage 呼叫的耗時與失敗次數
+
+    with timed('storage', 'upload'):
+        blob.upload_from_file(file)
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        FIREBASE_CALL_ERRORS.labels(service, operation).inc()
+        raise
+    finally:
+        FIREBASE_CALL_SECONDS.labels(service, operation).observe(time.perf_counter() - started)
+
+
+def timed_call(service, operation, func, *args, **kwargs):
+    """timed() 的函式版本，方便交給執行緒池執行"""
+    with timed(service, operation):
+        return func(*args, **kwargs)
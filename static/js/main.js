@@ -51,32 +51,6 @@ document.addEventListener('DOMContentLoaded', function() {
     });
 });
 
-// 搜尋功能
-function searchTable() {
-    const input = document.getElementById('searchInput');
-    const filter = input.value.toLowerCase();
-    const table = document.querySelector('.table tbody');
-    const rows = table.getElementsByTagName('tr');
-    
-    for (let i = 0; i < rows.length; i++) {
-        const cells = rows[i].getElementsByTagName('td');
-        let found = false;
-        
-        for (let j = 0; j < cells.length; j++) {
-            const cell = cells[j];
-            if (cell) {
-                const textValue = cell.textContent || cell.innerText;
-                if (textValue.toLowerCase().indexOf(filter) > -1) {
-                    found = true;
-                    break;
-                }
-            }
-        }
-        
-        rows[i].style.display = found ? '' : 'none';
-    }
-}
-
 // 確認刪除
 function confirmDelete(id) {
     return confirm('確定要刪除這筆記錄嗎？');
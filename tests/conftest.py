@@ -0,0 +1,30 @@
+"""以 fake_firebase 的記憶體 Firestore / Storage 執行 app.py 的測試"""
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as upload_app  # noqa: E402
+from fake_firebase import FakeBucket, FakeFirestore  # noqa: E402
+
+
+@pytest.fixture
+def fakes(monkeypatch):
+    """把 app.py 的 db 與 storage.bucket() 換成記憶體替身，回傳 (app 模組, Firestore, bucket)"""
+    client = FakeFirestore()
+    bucket = FakeBucket()
+    monkeypatch.setattr(upload_app, 'db', client)
+    monkeypatch.setattr(upload_app, 'storage', SimpleNamespace(bucket=lambda name=None: bucket))
+    # 不在背景建立下載全部快取，也不寫入 write-behind 日誌
+    monkeypatch.setattr(upload_app, 'schedule_archive_refresh', lambda: None)
+    monkeypatch.setattr(upload_app, 'submission_journal', None)
+    upload_app.app.config['TESTING'] = True
+    return upload_app, client, bucket
+
+
+@pytest.fixture
+def client(fakes):
+    return fakes[0].app.test_client()
@@ -0,0 +1,95 @@
+"""直傳 Storage API：建立上傳網址 → PUT → finalize → 重送 finalize"""
+
+
+def create_upload(client, files):
+    return client.post('/upload/direct', json={'child_name': '小明', 'parent_info': '小明媽媽', 'files': files})
+
+
+def put_file(fakes, upload, content):
+    """模擬瀏覽器以上傳網址 PUT 檔案 (由 upload_token 取得 Storage 路徑)"""
+    upload_app, _, bucket = fakes
+    info = upload_app.direct_upload_serializer().loads(upload['upload_token'])
+    bucket.blob(info['storage_path']).upload_from_string(content, content_type=upload['headers']['Content-Type'])
+    return info['storage_path']
+
+
+def submissions(firestore_client):
+    return [doc.to_dict() for doc in firestore_client.collection('submissions').stream()]
+
+
+def test_direct_upload_flow(fakes, client):
+    _, firestore_client, bucket = fakes
+    response = create_upload(client, [{'filename': '作業.pdf', 'size': 5, 'content_type': 'application/pdf'}])
+    assert response.status_code == 200
+    upload = response.get_json()['uploads'][0]
+    assert upload['method'] == 'PUT'
+    assert upload['headers']['x-goog-content-length-range'] == '0,5'
+
+    # 尚未上傳時不建立記錄
+    response = client.post('/upload/direct/finalize', json={'upload_tokens': [upload['upload_token']]})
+    assert response.get_json()['results'][0]['error'] == '檔案尚未上傳'
+    assert submissions(firestore_client) == []
+
+    storage_path = put_file(fakes, upload, b'%PDF-')
+    response = client.post('/upload/direct/finalize', json={'upload_tokens': [upload['upload_token']]})
+    assert response.get_json()['success_count'] == 1
+    records = submissions(firestore_client)
+    assert len(records) == 1
+    assert records[0]['storage_path'] == storage_path
+    assert records[0]['original_filename'] == '作業.pdf'
+    assert records[0]['file_size'] == 5
+    assert bucket.get_blob(storage_path).metadata == {'original_filename': '作業.pdf'}
+
+    # 重送同一個 token 不重複建立記錄
+    response = client.post('/upload/direct/finalize', json={'upload_tokens': [upload['upload_token']]})
+    assert response.get_json()['success_count'] == 1
+    assert len(submissions(firestore_client)) == 1
+
+
+def test_oversized_upload_is_rejected(fakes, client):
+    _, firestore_client, bucket = fakes
+    upload = create_upload(client, [{'filename': 'a.txt', 'size': 3}]).get_json()['uploads'][0]
+    storage_path = put_file(fakes, upload, b'too large')
+    response = client.post('/upload/direct/finalize', json={'upload_tokens': [upload['upload_token']]})
+    assert response.get_json()['results'][0]['error'] == '檔案大小與宣告不符'
+    assert bucket.get_blob(storage_path) is None
+    assert submissions(firestore_client) == []
+
+
+def test_invalid_file_entries_get_per_file_errors(client):
+    response = create_upload(client, ['a.png', {'filename': 'a.exe', 'size': 1}, {'filename': 'b.png', 'size': 1}])
+    assert response.status_code == 200
+    uploads = response.get_json()['uploads']
+    assert 'error' in uploads[0]
+    assert uploads[1]['error'] == '不支援的檔案格式'
+    assert 'upload_token' in uploads[2]
+
+
+def test_malformed_payloads(client):
+    assert client.post('/upload/direct', json=['a.png']).status_code == 400
+    assert client.post('/upload/direct/finalize', json=['token']).status_code == 400
+    response = client.post('/upload/direct/finalize', json={'upload_tokens': ['forged']})
+    assert response.get_json()['results'][0]['error'] == '無效或已過期的 upload_token'
+
+
+def test_finalize_twice_with_journal(fakes, client, monkeypatch, tmp_path):
+    """啟用日誌時，第一次 finalize 的記錄尚未寫入 Firestore 就重送，仍只建立一筆記錄"""
+    upload_app, firestore_client, _ = fakes
+    journal = upload_app.SubmissionJournal(str(tmp_path), interval=0)
+    monkeypatch.setattr(journal, 'start', lambda: None)
+    monkeypatch.setattr(upload_app, 'submission_journal', journal)
+
+    upload = create_upload(client, [{'filename': '作業.pdf', 'size': 5}]).get_json()['uploads'][0]
+    put_file(fakes, upload, b'%PDF-')
+    # 兩次 finalize 各自寫入一個日誌檔 (模擬背景執行緒在兩次請求之間換檔)
+    for _ in range(2):
+        response = client.post('/upload/direct/finalize', json={'upload_tokens': [upload['upload_token']]})
+        assert response.get_json()['success_count'] == 1
+        journal._sealed.append(journal._segment)
+        journal._segment = None
+    assert submissions(firestore_client) == []
+
+    assert journal.flush()
+    assert journal.pending() == 0
+    assert len(submissions(firestore_client)) == 1
+    assert upload_app.read_submission_stats()['count'] == 1